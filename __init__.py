@@ -1,3 +1,11 @@
 from .sarpy.sarpy_class import SarImage
 from .sarpy.load import s1_load
 from .sarpy.load import load
+from .sarpy.load import s1_calibrate
+from .sarpy.lazy_band import LazyBand
+from .sarpy.stack import SarStack
+from .sarpy.stack import create_stack
+from .sarpy.pipeline import Pipeline
+from .sarpy.product import S1Product
+from .sarpy.product import open_s1
+from .sarpy.cache import MetaCache
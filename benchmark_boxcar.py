@@ -0,0 +1,38 @@
+"""Benchmark of the boxcar filter in sarpy.tools.
+
+Compares the running sum boxcar (default) with the earlier convolution boxcar for a range of kernel sizes.
+Run from the folder containing the sarpy folder: python benchmark_boxcar.py
+"""
+import time
+import numpy as np
+from sarpy import tools
+
+
+def benchmark(shape=(4000, 4000), kernel_sizes=(3, 5, 7, 9, 15, 31), repeat=3):
+    """Print the time of each boxcar method for each kernel size.
+
+    Args:
+        shape(tuple): shape of the random float64 test image
+        kernel_sizes(list of int): kernel sizes to test
+        repeat(int): the best time of repeat runs is printed
+    """
+    img = np.random.default_rng(0).random(shape)
+    print('image %s float64' % str(shape))
+    print('%12s %15s %15s %10s %12s' % ('kernel_size', 'convolve [s]', 'running_sum [s]', 'speedup', 'max diff'))
+    for kernel_size in kernel_sizes:
+        times = {}
+        results = {}
+        for method in ('convolve', 'running_sum'):
+            best = np.inf
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results[method] = tools.boxcar(img, kernel_size, method=method)
+                best = min(best, time.perf_counter() - start)
+            times[method] = best
+        difference = np.abs(results['convolve'] - results['running_sum']).max()
+        print('%12d %15.3f %15.3f %10.1f %12.1e' % (kernel_size, times['convolve'], times['running_sum'],
+                                                    times['convolve'] / times['running_sum'], difference))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,3 +1,11 @@
 from .sarpy_class import SarImage
 from .load import s1_load
 from .load import load
+from .load import s1_calibrate
+from .lazy_band import LazyBand
+from .stack import SarStack
+from .stack import create_stack
+from .pipeline import Pipeline
+from .product import S1Product
+from .product import open_s1
+from .cache import MetaCache
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from . import storage
+
+# Part of the key. Increase when the parsed format changes, so old entries are not used
+CACHE_VERSION = 2
+
+
+class MetaCache:
+    """ On-disk cache of the parsed meta data (manifest, annotation, calibration and noise XML) of Sentinel 1
+    products.
+
+    Each product has a folder in directory with the meta data as json and the tables as npz (see storage).
+    The key is the path of the product and the size and modification time of each parsed XML file, so
+    changed products are parsed again. The least recently used products are removed when the cache is
+    larger than max_size.
+
+    Example:
+        cache = MetaCache('~/.cache/sarpy')
+        img = s1_load(path, cache=cache)
+
+    Attributes:
+        directory(str): folder of the cache. Created if it does not exist
+        max_size(int): maximum size of the cache in bytes
+    """
+
+    def __init__(self, directory, max_size=2 ** 30):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return "MetaCache: %s" % self.directory
+
+    def key(self, path, files):
+        """Key of a product.
+
+            Args:
+                path(str): Path to the folder containing the SAR image
+                files(list of str): the parsed files relative to path
+
+            Returns:
+                key(str)
+        """
+        digest = hashlib.sha1(('%d %s' % (CACHE_VERSION, os.path.abspath(path))).encode())
+        for file in sorted(files):
+            stat = os.stat(os.path.join(path, file))
+            digest.update(('\n%s %d %d' % (file, stat.st_size, stat.st_mtime_ns)).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Parsed meta data of key or None if it is not in the cache.
+
+            Returns:
+                meta(dict): meta data written with put
+                tables(dict): tables written with put
+        """
+        entry = os.path.join(self.directory, key)
+        try:
+            meta = storage.read_meta(os.path.join(entry, storage.META_FILE))
+            tables = storage.read_tables(os.path.join(entry, storage.TABLES_FILE))
+            # Mark as recently used
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return meta, tables
+
+    def put(self, key, meta, **tables):
+        """Add parsed meta data to the cache and remove the least recently used entries if it is too large.
+
+            Args:
+                key(str): key from the key method
+                meta(dict): meta data. Saved with storage.write_meta
+                **tables: lists of dictionaries with numpy arrays. Saved with storage.write_tables
+        """
+        entry = os.path.join(self.directory, key)
+        # Write to a temporary folder and rename, so other processes never see a partial entry
+        temporary = tempfile.mkdtemp(dir=self.directory, prefix='.tmp')
+        try:
+            storage.write_meta(os.path.join(temporary, storage.META_FILE), meta)
+            storage.write_tables(os.path.join(temporary, storage.TABLES_FILE), **tables)
+            os.rename(temporary, entry)
+        except OSError:
+            # Another process added the entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache is not larger than max_size"""
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('.') or not os.path.isdir(entry):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, file)) for file in os.listdir(entry))
+            entries.append((os.path.getmtime(entry), size, entry))
+
+        total = sum(size for used, size, entry in entries)
+        for used, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        """Remove all entries"""
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
@@ -1,6 +1,106 @@
 import numpy as np
 from scipy import interpolate
-from scipy.optimize import minimize
+from scipy.spatial import Delaunay
+
+
+def get_triangulation(x_gridpoints, y_gridpoints):
+    """Delaunay triangulation of grid-points. Building the triangulation is the expensive part of the
+    interpolation, so it can be built once and passed to get_coordinates or get_indices_v1.
+
+    Args:
+        x_gridpoints(numpy array of length n): first coordinate of grid-points. e.g. row or latitude
+        y_gridpoints(numpy array of length n): second coordinate of grid-points. e.g. column or longitude
+
+    Returns:
+        triangulation(scipy.spatial.Delaunay)
+    """
+    return Delaunay(np.vstack([x_gridpoints, y_gridpoints]).transpose())
+
+
+def tie_point_grid(geo_tie_point, key):
+    """Arrange geo tie points on their regular (row, column) grid.
+
+    Args:
+        geo_tie_point(dict): geo tie points of a band. e.g. SarImage.geo_tie_point[0]
+        key(str): The values to arrange. e.g. 'latitude', 'longitude' or 'incidence_angle'
+
+    Returns:
+        rows(numpy array of length n): rows of the grid
+        columns(numpy array of length m): columns of the grid
+        values(2d numpy array with shape (n, m)): values at the grid points
+
+    Raises:
+        ValueError: The tie points are not on a regular grid
+    """
+    rows, row_index = np.unique(geo_tie_point['row'], return_inverse=True)
+    columns, column_index = np.unique(geo_tie_point['column'], return_inverse=True)
+    if len(rows) * len(columns) != len(geo_tie_point['row']):
+        raise ValueError('The geo tie points are not on a regular grid')
+    values = np.full((len(rows), len(columns)), np.nan)
+    values[row_index, column_index] = geo_tie_point[key]
+    if np.isnan(values).any():
+        raise ValueError('The geo tie points are not on a regular grid')
+    return rows, columns, values
+
+
+def _interpolate_triangulation(triangulation, values, x, y):
+    # Linear interpolation on a triangulation. Same as scipy.interpolate.griddata(method='linear')
+    f = interpolate.LinearNDInterpolator(triangulation, np.vstack(values).transpose())
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    result = f(np.stack([x.reshape(-1), y.reshape(-1)], axis=1))
+    return [result[:, i].reshape(x.shape) for i in range(len(values))]
+
+
+def get_coordinates(rows, columns, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints,
+                    triangulation=None):
+    """Get coordinates of many indices by interpolating grid-points. Vectorised version of get_coordinate
+
+    Args:
+        rows(numpy array): row indices of the positions
+        columns(numpy array): column indices of the positions
+        lat_gridpoints(numpy array of length n): Latitude of grid-points
+        long_gridpoints(numpy array of length n): Longitude of grid-points
+        row_gridpoints(numpy array of length n): row of grid-points
+        column_gridpoints(numpy array of length n): column of grid-points
+        triangulation(scipy.spatial.Delaunay): triangulation of (row_gridpoints, column_gridpoints) from
+                        get_triangulation. If None it is calculated
+
+    Returns:
+        lat(numpy array): Latitude of the positions. nan outside the grid
+        long(numpy array): longitude of the positions. nan outside the grid
+
+    Raises:
+    """
+    if triangulation is None:
+        triangulation = get_triangulation(row_gridpoints, column_gridpoints)
+    lat, long = _interpolate_triangulation(triangulation, [lat_gridpoints, long_gridpoints], rows, columns)
+    return lat, long
+
+
+def get_indices_v1(lats, longs, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints,
+                   triangulation=None):
+    """Get indices of many locations by interpolating grid-points. Vectorised version of get_index_v1
+
+    Args:
+        lats(numpy array): Latitude of the locations
+        longs(numpy array): Longitude of the locations
+        lat_gridpoints(numpy array of length n): Latitude of grid-points
+        long_gridpoints(numpy array of length n): Longitude of grid-points
+        row_gridpoints(numpy array of length n): row of grid-points
+        column_gridpoints(numpy array of length n): column of grid-points
+        triangulation(scipy.spatial.Delaunay): triangulation of (lat_gridpoints, long_gridpoints) from
+                        get_triangulation. If None it is calculated
+
+    Returns:
+        rows(numpy array of float): The row index of the locations (not rounded). nan outside the grid
+        columns(numpy array of float): The column index of the locations (not rounded). nan outside the grid
+
+    Raises:
+    """
+    if triangulation is None:
+        triangulation = get_triangulation(lat_gridpoints, long_gridpoints)
+    rows, columns = _interpolate_triangulation(triangulation, [row_gridpoints, column_gridpoints], lats, longs)
+    return rows, columns
 
 
 def get_coordinate(row, column, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints):
@@ -21,11 +121,8 @@ def get_coordinate(row, column, lat_gridpoints, long_gridpoints, row_gridpoints,
     Raises:
     """
 
-    # Create interpolate functions
-    points = np.vstack([row_gridpoints, column_gridpoints]).transpose()
-    lat = float(interpolate.griddata(points, lat_gridpoints, (row, column)))
-    long = float(interpolate.griddata(points, long_gridpoints, (row, column)))
-    return lat, long
+    lat, long = get_coordinates(row, column, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints)
+    return float(lat), float(long)
 
 
 def get_index_v1(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints):
@@ -46,28 +143,98 @@ def get_index_v1(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, col
     Raises:
     """
 
-    points = np.vstack([lat_gridpoints, long_gridpoints]).transpose()
-    row = int(np.round(interpolate.griddata(points, row_gridpoints, (lat, long))))
-    column = int(np.round(interpolate.griddata(points, column_gridpoints, (lat, long))))
-    return row, column
+    row, column = get_indices_v1(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints)
+    return int(np.round(row)), int(np.round(column))
 
 
-def get_index_v2(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints):
-    """
-    Same as "get_index_v1" but consistent with "get_coordinate". Drawback is that it is slower
-    """
+def _barycentric(vertices, points):
+    # Barycentric coordinates of points (n, 2) in triangles with vertices (n, 3, 2)
+    a = vertices[:, 0, :]
+    ab = vertices[:, 1, :] - a
+    ac = vertices[:, 2, :] - a
+    d = points - a
+    det = ab[:, 0] * ac[:, 1] - ac[:, 0] * ab[:, 1]
+    l1 = (d[:, 0] * ac[:, 1] - d[:, 1] * ac[:, 0]) / det
+    l2 = (ab[:, 0] * d[:, 1] - ab[:, 1] * d[:, 0]) / det
+    return np.stack([1 - l1 - l2, l1, l2], axis=1)
+
 
-    # Get an initial guess
-    row_i, column_i = get_index_v1(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints)
+def get_indices_v2(lats, longs, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints,
+                   triangulation=None, index_triangulation=None):
+    """Get indices of many locations as the exact inverse of get_coordinates.
 
-    # Define a loss function
-    def loss_function(index):
-        lat_res, long_res = get_coordinate(index[0], index[1], lat_gridpoints, long_gridpoints, row_gridpoints,
-                                           column_gridpoints)
-        return ((lat - lat_res) * 100) ** 2 + ((long - long_res) * 100) ** 2
+    get_coordinates is linear in each triangle of the triangulation of (row, column). The triangles are
+    mapped to (latitude, longitude), the triangle containing each location is found by walking from the
+    triangle given by get_indices_v1 and the index is found in closed form from the barycentric coordinates.
+    Locations outside the grid are extrapolated linearly from the nearest triangle on the border.
 
-    # Find the index where "get_coordinate" gives the closest coordinates
-    res = minimize(loss_function, [row_i, column_i])
+    Args:
+        lats(numpy array): Latitude of the locations
+        longs(numpy array): Longitude of the locations
+        lat_gridpoints(numpy array of length n): Latitude of grid-points
+        long_gridpoints(numpy array of length n): Longitude of grid-points
+        row_gridpoints(numpy array of length n): row of grid-points
+        column_gridpoints(numpy array of length n): column of grid-points
+        triangulation(scipy.spatial.Delaunay): triangulation of (row_gridpoints, column_gridpoints) from
+                        get_triangulation. If None it is calculated
+        index_triangulation(scipy.spatial.Delaunay): triangulation of (lat_gridpoints, long_gridpoints) from
+                        get_triangulation. Used for the initial guess. If None it is calculated
 
-    return int(round(res.x[0])), int(round(res.x[1]))
+    Returns:
+        rows(numpy array of float): The row index of the locations (not rounded)
+        columns(numpy array of float): The column index of the locations (not rounded)
 
+    Raises:
+    """
+    if triangulation is None:
+        triangulation = get_triangulation(row_gridpoints, column_gridpoints)
+    lats, longs = np.broadcast_arrays(np.asarray(lats, dtype=float), np.asarray(longs, dtype=float))
+    shape = lats.shape
+    points = np.stack([lats.reshape(-1), longs.reshape(-1)], axis=1)
+    coordinates = np.stack([lat_gridpoints, long_gridpoints], axis=1).astype(float)
+    indices = np.stack([row_gridpoints, column_gridpoints], axis=1).astype(float)
+
+    # Initial guess
+    rows, columns = get_indices_v1(points[:, 0], points[:, 1], lat_gridpoints, long_gridpoints, row_gridpoints,
+                                   column_gridpoints, triangulation=index_triangulation)
+    guess = np.stack([rows, columns], axis=1)
+    outside = np.isnan(guess).any(axis=1)
+    if outside.any():
+        # Start at the nearest grid-point
+        nearest = [np.argmin(((coordinates - point) ** 2).sum(axis=1)) for point in points[outside]]
+        guess[outside] = indices[nearest]
+    guess = np.clip(guess, indices.min(axis=0), indices.max(axis=0))
+    simplex = triangulation.find_simplex(guess)
+    simplex[simplex == -1] = 0
+
+    # Walk towards the triangle that contains the location
+    result = np.full(points.shape, np.nan)
+    active = np.arange(len(points))
+    for _ in range(len(triangulation.simplices)):
+        if len(active) == 0:
+            break
+        vertices = triangulation.simplices[simplex[active]]
+        weights = _barycentric(coordinates[vertices], points[active])
+        most_negative = weights.argmin(axis=1)
+        neighbor = triangulation.neighbors[simplex[active], most_negative]
+        done = (weights[np.arange(len(active)), most_negative] >= -1e-9) | (neighbor == -1)
+        result[active[done]] = (weights[done, :, np.newaxis] * indices[vertices[done]]).sum(axis=1)
+        simplex[active[~done]] = neighbor[~done]
+        active = active[~done]
+
+    # Locations where the walk did not end. Use the triangle where the location is the least outside
+    for i in active:
+        weights = _barycentric(coordinates[triangulation.simplices],
+                               np.tile(points[i], (len(triangulation.simplices), 1)))
+        best = weights.min(axis=1).argmax()
+        result[i] = weights[best] @ indices[triangulation.simplices[best]]
+
+    return result[:, 0].reshape(shape), result[:, 1].reshape(shape)
+
+
+def get_index_v2(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints):
+    """
+    Same as "get_index_v1" but consistent with "get_coordinate". See get_indices_v2
+    """
+    row, column = get_indices_v2(lat, long, lat_gridpoints, long_gridpoints, row_gridpoints, column_gridpoints)
+    return int(round(float(row))), int(round(float(column)))
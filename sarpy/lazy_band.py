@@ -0,0 +1,125 @@
+import numpy as np
+import threading
+import weakref
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+# rasterio datasets can not be read from several threads at the same time. One lock per dataset.
+# The lock is removed when the dataset is garbage collected
+_locks = weakref.WeakKeyDictionary()
+_locks_lock = threading.Lock()
+
+
+def _dataset_lock(dataset):
+    with _locks_lock:
+        lock = _locks.get(dataset)
+        if lock is None:
+            lock = _locks[dataset] = threading.Lock()
+        return lock
+
+
+class LazyBand(NDArrayOperatorsMixin):
+    """ A band in an open rasterio dataset that is first read when it is indexed or computed on.
+    Can be used in place of a numpy array in SarImage.bands.
+
+    Indexing (band[10:20, 5:50]) only reads the window that is needed. Numpy functions and
+    arithmetic (np.log(band), band * 2) read the entire window and return numpy arrays.
+    Reading is thread safe. Reads from the same dataset are done one at the time.
+
+    Attributes:
+        dataset(rasterio dataset): The open dataset
+        band(int): Index of the band in the dataset (starting at 1 as in rasterio)
+        window(tuple): ((row_start, row_stop), (column_start, column_stop)) window of the dataset
+        shape(tuple): Shape of the window
+        dtype(numpy dtype): Data type of the band
+        out_dtype(numpy dtype): Data type the band is read as. None to read in the type of the dataset.
+                    Complex int16 bands (Sentinel 1 SLC) have no numpy type and are read as complex64
+    """
+
+    def __init__(self, dataset, band=1, window=None, out_dtype=None):
+        if window is None:
+            window = ((0, dataset.height), (0, dataset.width))
+        if out_dtype is None and dataset.dtypes[band - 1] == 'complex_int16':
+            out_dtype = np.complex64
+        self.dataset = dataset
+        self.band = band
+        self.window = tuple(tuple(int(i) for i in elem) for elem in window)
+        self.shape = (self.window[0][1] - self.window[0][0], self.window[1][1] - self.window[1][0])
+        self.out_dtype = None if out_dtype is None else np.dtype(out_dtype)
+        self.dtype = self.out_dtype if out_dtype is not None else np.dtype(dataset.dtypes[band - 1])
+
+    def __repr__(self):
+        return "LazyBand: %s band %d window %s" % (self.dataset.name, self.band, str(self.window))
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, window=None):
+        """Read a window of the band.
+
+        Args:
+            window(tuple): ((row_start, row_stop), (column_start, column_stop)) relative to the band.
+                            If None the entire band is read
+
+        Returns:
+            2d numpy array
+        """
+        if window is None:
+            window = ((0, self.shape[0]), (0, self.shape[1]))
+        window = ((self.window[0][0] + window[0][0], self.window[0][0] + window[0][1]),
+                  (self.window[1][0] + window[1][0], self.window[1][0] + window[1][1]))
+        with _dataset_lock(self.dataset):
+            if self.out_dtype is not None:
+                return self.dataset.read(self.band, window=window, out_dtype=self.out_dtype)
+            return self.dataset.read(self.band, window=window)
+
+    def __array__(self, dtype=None, copy=None):
+        band = self.read()
+        if dtype is not None:
+            band = band.astype(dtype, copy=False)
+        return band
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [np.asarray(elem) if isinstance(elem, LazyBand) else elem for elem in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError('LazyBand is 2 dimensional')
+
+        # Find the window to read and how to index it afterwards
+        window = []
+        local_key = []
+        for elem, n in zip(key, self.shape):
+            if isinstance(elem, slice):
+                index = range(*elem.indices(n))
+                if len(index) == 0:
+                    window.append((0, 0))
+                    local_key.append(slice(None))
+                    continue
+                start = min(index[0], index[-1])
+                stop = max(index[0], index[-1]) + 1
+                local_stop = index.stop - start
+                window.append((start, stop))
+                local_key.append(slice(index.start - start, local_stop if local_stop >= 0 else None, index.step))
+            else:
+                elem = int(elem)
+                if elem < 0:
+                    elem += n
+                if not 0 <= elem < n:
+                    raise IndexError('index %d is out of bounds for axis with size %d' % (elem, n))
+                window.append((elem, elem + 1))
+                local_key.append(0)
+
+        if any(start == stop for start, stop in window):
+            return np.zeros([stop - start for start, stop in window], dtype=self.dtype)[tuple(local_key)]
+        return self.read(window)[tuple(local_key)]
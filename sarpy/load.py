@@ -4,31 +4,34 @@ import pickle
 import warnings
 from itertools import compress
 import rasterio
+from rasterio.control import GroundControlPoint
+from rasterio.enums import Resampling
+from rasterio import features
 
 from .sarpy_class import SarImage
+from .lazy_band import LazyBand
 from . import s1
-from .get_functions import get_index_v2, get_coordinate
+from . import tools
+from . import storage
+from .cache import MetaCache
+from .get_functions import get_index_v2, get_indices_v2, get_coordinates
 
+# Average the intensities (root mean square of the amplitudes) when reading multilooked bands.
+# rms resampling requires GDAL >= 3.3 (rasterio has the enum member for any GDAL). Older GDAL averages the amplitudes
+_MULTILOOK_RESAMPLING = (Resampling.rms
+                         if tuple(int(part) for part in rasterio.__gdal_version__.split('.')[:2]) >= (3, 3)
+                         else Resampling.average)
 
-def s1_load(path, polarisation='all', location=None, size=None):
-    """Function to load SAR image into SarImage python object.
-        Currently supports: unzipped Sentinel 1 GRDH products
 
-        Args:
-            path(number): Path to the folder containing the SAR image
-                    as retrieved from: https://scihub.copernicus.eu/
-            polarisation(list of str): List of polarisations to load.
-            location(array/list): [latitude,longitude] Location to center the image.
-                                    If None the entire Image is loaded
-            size(array/list): [width, height] Extend of image to load.
-                                    If None the entire Image is loaded
+def _parse_s1(path, workers=None):
+    """Parse manifest.safe and the annotation, calibration and noise XML files of a Sentinel 1 product.
 
         Returns:
-            SarImage: object with the SAR measurements and meta data from path. Meta data index
-                    and foot print are adjusted to the window
-
-        Raises:
-            ValueError: Location not in image
+            meta(dict): meta data from manifest.safe
+            annotation(list of tuple): (geo_tie_point, band_meta) of each annotation file
+            calibration(list of tuple): (calibration table, info) of each calibration file. The noise table
+                    (see s1._load_noise) of the same polarisation and swath is added to the calibration table
+                    with the key 'noise'
         """
     # manifest.safe
     path_safe = os.path.join(path, 'manifest.safe')
@@ -38,14 +41,98 @@ def s1_load(path, polarisation='all', location=None, size=None):
     ls_annotation = os.listdir(os.path.join(path, 'annotation'))
     xml_files = [file[-3:] == 'xml' for file in ls_annotation]
     xml_files = list(compress(ls_annotation, xml_files))
-    annotation_temp = [s1._load_annotation(os.path.join(path, 'annotation', file)) for file in xml_files]
+    annotation_temp = tools.parallel_map(s1._load_annotation,
+                                         [os.path.join(path, 'annotation', file) for file in xml_files], workers)
 
     # calibration_tables
     path_cal = os.path.join(path, 'annotation', 'calibration')
     ls_cal = os.listdir(path_cal)
     cal_files = [file[:11] == 'calibration' for file in ls_cal]
     cal_files = list(compress(ls_cal, cal_files))
-    calibration_temp = [s1._load_calibration(os.path.join(path_cal, file)) for file in cal_files]
+    calibration_temp = tools.parallel_map(s1._load_calibration,
+                                          [os.path.join(path_cal, file) for file in cal_files], workers)
+
+    # noise
+    noise_files = [file for file in ls_cal if file[:5] == 'noise']
+    noise_temp = tools.parallel_map(s1._load_noise, [os.path.join(path_cal, file) for file in noise_files], workers)
+    for table, info in calibration_temp:
+        for noise_table, noise_info in noise_temp:
+            if table is not None and noise_table is not None and info is not None and noise_info is not None \
+                    and (info.get('polarisation'), info.get('swath')) == \
+                    (noise_info.get('polarisation'), noise_info.get('swath')):
+                table['noise'] = noise_table
+    return meta, annotation_temp, calibration_temp
+
+
+def _parsed_files(path):
+    """The files parsed by _parse_s1 relative to path"""
+    annotation = [os.path.join('annotation', file) for file in os.listdir(os.path.join(path, 'annotation'))
+                  if file[-3:] == 'xml']
+    calibration = [os.path.join('annotation', 'calibration', file)
+                   for file in os.listdir(os.path.join(path, 'annotation', 'calibration'))
+                   if file[:11] == 'calibration' or file[:5] == 'noise']
+    return ['manifest.safe'] + annotation + calibration
+
+
+def _parse_s1_cached(path, cache, workers=None):
+    """_parse_s1 using cache (MetaCache). The product is parsed and added to the cache if it is not there"""
+    key = cache.key(path, _parsed_files(path))
+    cached = cache.get(key)
+    if cached is not None:
+        meta, tables = cached
+        annotation_temp = list(zip(tables['geo_tie_point'], meta['band_meta']))
+        calibration_temp = list(zip(tables['calibration_tables'], meta['calibration_info']))
+        return meta['meta'], annotation_temp, calibration_temp
+
+    meta, annotation_temp, calibration_temp = _parse_s1(path, workers)
+    cache.put(key, {'meta': meta, 'band_meta': [elem[1] for elem in annotation_temp],
+                    'calibration_info': [elem[1] for elem in calibration_temp]},
+              geo_tie_point=[elem[0] for elem in annotation_temp],
+              calibration_tables=[elem[0] for elem in calibration_temp])
+    return meta, annotation_temp, calibration_temp
+
+
+def _parse_product(path, workers=None, cache=None):
+    """_parse_s1 with or without cache (MetaCache or the folder of one)"""
+    if cache is None:
+        return _parse_s1(path, workers)
+    if isinstance(cache, str):
+        cache = MetaCache(cache)
+    return _parse_s1_cached(path, cache, workers)
+
+
+def _open_s1(path, polarisation='all', workers=None, cache=None):
+    """Parse the meta data of a Sentinel 1 product and open the measurement tiff files.
+
+        Args:
+            path(str): Path to the folder containing the SAR image
+            polarisation(list of str): List of polarisations to open. 'all' opens all polarisations
+            workers(int or concurrent.futures.Executor): Parse and open the files in parallel threads
+            cache(MetaCache or str): Cache of the parsed meta data or the folder of one. If None the
+                    meta data is parsed
+
+        Returns:
+            meta(dict): meta data from manifest.safe
+            polarisation(list of str): The opened polarisations
+            measurement(list of rasterio datasets): measurement of each polarisation
+            calibration_tables(list of dict): calibration tables of each polarisation
+            geo_tie_point(list of dict): geo tie points of each polarisation
+            band_meta(list of dict): meta data of each polarisation
+
+        Raises:
+            ValueError: A polarisation is not in the product
+        """
+    meta, annotation_temp, calibration_temp = _parse_product(path, workers, cache)
+
+    # Check if polarisation is given
+    if polarisation == 'all':
+        polarisation = meta['polarisation']
+    else:
+        polarisation = [elem.upper() for elem in polarisation]
+        unknown = [elem for elem in polarisation if elem not in meta['polarisation']]
+        if unknown:
+            raise ValueError('Polarisation %s not in the product. Available polarisations: %s'
+                             % (', '.join(unknown), ', '.join(meta['polarisation'])))
 
     # measurement
     measurement_path = os.path.join(path, 'measurement')
@@ -54,13 +141,8 @@ def s1_load(path, polarisation='all', location=None, size=None):
     tiff_files = list(compress(ls_meas, tiff_files))
     with warnings.catch_warnings(): # Ignore the "NotGeoreferencedWarning" when opening the tiff
         warnings.simplefilter("ignore")
-        measurement_temp = [rasterio.open(os.path.join(measurement_path, file)) for file in tiff_files]
-
-    # Check if polarisation is given
-    if polarisation == 'all':
-        polarisation = meta['polarisation']
-    else:
-        polarisation = [elem.upper() for elem in polarisation]
+        measurement_temp = tools.parallel_map(rasterio.open,
+                                              [os.path.join(measurement_path, file) for file in tiff_files], workers)
 
     # only take bands of interest and sort
     n_bands = len(polarisation)
@@ -89,88 +171,422 @@ def s1_load(path, polarisation='all', location=None, size=None):
         if measurement[i].count != 1:
             warnings.warn('Warning tiff file contains several bands. First band read from each tiff file')
 
+    return meta, polarisation, measurement, calibration_tables, geo_tie_point, band_meta
+
+
+def _polygon_rings(polygon):
+    """Rings of (longitude, latitude) vertices of each polygon in a GeoJSON like object.
+
+        Args:
+            polygon(dict or list): GeoJSON Polygon, MultiPolygon, Feature or FeatureCollection, an object with
+                    __geo_interface__ or a list of (longitude, latitude) vertices
+
+        Returns:
+            list of polygons. Each polygon is a list of rings (n x 2 numpy arrays). The first ring is the
+            exterior and the rest are holes
+
+        Raises:
+            ValueError: Unsupported geometry type
+        """
+    if hasattr(polygon, '__geo_interface__'):
+        polygon = polygon.__geo_interface__
+    if not isinstance(polygon, dict):
+        return [[np.asarray(polygon, dtype=float)]]
+
+    geometry_type = polygon.get('type')
+    if geometry_type == 'FeatureCollection':
+        return [rings for feature in polygon['features'] for rings in _polygon_rings(feature)]
+    if geometry_type == 'Feature':
+        return _polygon_rings(polygon['geometry'])
+    if geometry_type == 'Polygon':
+        return [[np.asarray(ring, dtype=float)[:, :2] for ring in polygon['coordinates']]]
+    if geometry_type == 'MultiPolygon':
+        return [[np.asarray(ring, dtype=float)[:, :2] for ring in rings] for rings in polygon['coordinates']]
+    raise ValueError('Unsupported geometry type %s. Use Polygon or MultiPolygon' % geometry_type)
+
+
+def _ring_indices(ring, geo_tie_point, points_per_edge=16):
+    """Row and column of a ring of (longitude, latitude) vertices with points added along the edges.
+    Straight edges in latitude and longitude are not straight in the image, so the edges are densified."""
+    ring = np.asarray(ring, dtype=float)
+    closed = np.vstack([ring, ring[:1]])
+    fraction = np.arange(points_per_edge)[:, np.newaxis, np.newaxis] / points_per_edge
+    dense = (closed[:-1] + fraction * (closed[1:] - closed[:-1])).transpose(1, 0, 2).reshape(-1, 2)
+    return get_indices_v2(dense[:, 1], dense[:, 0], geo_tie_point['latitude'], geo_tie_point['longitude'],
+                          geo_tie_point['row'], geo_tie_point['column'])
+
+
+def _polygon_window(polygons, geo_tie_point, shape):
+    """Smallest window ((row_start, row_stop), (column_start, column_stop)) of an image with shape
+    containing the polygons (from _polygon_rings)
+
+        Raises:
+            ValueError: The polygons are not inside the image
+        """
+    indices = [_ring_indices(rings[0], geo_tie_point) for rings in polygons]
+    rows = np.concatenate([row for row, column in indices])
+    columns = np.concatenate([column for row, column in indices])
+
+    row_start = max(int(np.floor(rows.min())), 0)
+    row_stop = min(int(np.ceil(rows.max())) + 1, shape[0])
+    column_start = max(int(np.floor(columns.min())), 0)
+    column_stop = min(int(np.ceil(columns.max())) + 1, shape[1])
+    if row_start >= row_stop or column_start >= column_stop:
+        raise ValueError('Polygon not inside the image')
+    return (row_start, row_stop), (column_start, column_stop)
+
+
+def _polygon_mask(polygons, geo_tie_point, shape):
+    """Boolean array with shape that is True for the pixels with the centre inside the polygons"""
+    shapes = []
+    for rings in polygons:
+        pixel_rings = []
+        for ring in rings:
+            row, column = _ring_indices(ring, geo_tie_point)
+            # Pixel (row, column) covers [column, column + 1) x [row, row + 1) in the rasterize coordinates
+            pixel_rings.append(np.column_stack([column + 0.5, row + 0.5]).tolist())
+        shapes.append(({'type': 'Polygon', 'coordinates': pixel_rings}, 1))
+    return features.rasterize(shapes, out_shape=shape, fill=0, dtype='uint8').astype(bool)
+
+
+def _location_window(location, size, footprint, geo_tie_point, shape):
+    """Window of size [height, width] centred at location [latitude, longitude].
+    The window is constrained to the image with a warning.
+
+        Raises:
+            ValueError: Location or window not in image
+        """
+    # Check location is in foot print
+    maxlat = footprint['latitude'].max()
+    minlat = footprint['latitude'].min()
+    maxlong = footprint['longitude'].max()
+    minlong = footprint['longitude'].min()
+
+    if not (minlat < location[0] < maxlat) & (minlong < location[1] < maxlong):
+        raise ValueError('Location not inside the footprint')
+
+    # get the index
+    row = np.zeros(len(geo_tie_point), dtype=int)
+    column = np.zeros(len(geo_tie_point), dtype=int)
+    for i in range(len(geo_tie_point)):
+        lat_grid = geo_tie_point[i]['latitude']
+        long_grid = geo_tie_point[i]['longitude']
+        row_grid = geo_tie_point[i]['row']
+        column_grid = geo_tie_point[i]['column']
+        row[i], column[i] = get_index_v2(location[0], location[1], lat_grid, long_grid, row_grid, column_grid)
+    # check if index are the same for all bands
+    if (abs(row.max() - row.min()) > 0.5) or (abs(column.max() - column.min()) > 0.5):
+        warnings.warn('Warning different index found for each band. First index returned')
+
+    # Find the window
+    row_index_min = row[0] - int(size[0]/2)
+    row_index_max = row[0] + int(size[0]/2)
+
+    column_index_min = column[0] - int(size[1]/2)
+    column_index_max = column[0] + int(size[1]/2)
+
+    # Check if window is in image
+    if row_index_max < 0 or column_index_max < 0:
+        raise ValueError('Error window not in image ')
+
+    if row_index_min < 0:
+        warnings.warn('Extend out of image. Window constrained ')
+        row_index_min = 0
+
+    if column_index_min < 0:
+        warnings.warn('Extend out of image. Window constrained ')
+        column_index_min = 0
+
+    if row_index_min > shape[0] or column_index_min > shape[1]:
+        raise ValueError('Error window not in image')
+
+    if row_index_max > shape[0]:
+        warnings.warn('Extend out of image. Window constrained ')
+        row_index_max = shape[0]
+
+    if column_index_max > shape[1]:
+        warnings.warn('Extend out of image. Window constrained ')
+        column_index_max = shape[1]
+
+    return (row_index_min, row_index_max), (column_index_min, column_index_max)
+
+
+def _resolve_window(shape, footprint, geo_tie_point, location=None, size=None, bbox=None, polygon=None):
+    """Pixel window given by location and size, bbox or polygon. See s1_load
+
+        Returns:
+            window(tuple): ((row_start, row_stop), (column_start, column_stop)). None for the entire image
+            polygons(list): polygons from _polygon_rings. None if no bbox or polygon is given
+
+        Raises:
+            ValueError: More than one of location, bbox and polygon is given
+        """
+    given = [name for name, value in (('location', location), ('bbox', bbox), ('polygon', polygon))
+             if value is not None]
+    if len(given) > 1:
+        raise ValueError('Give only one of location, bbox and polygon. Got %s' % ' and '.join(given))
+    if bbox is not None:
+        min_long, min_lat, max_long, max_lat = bbox
+        polygon = [(min_long, min_lat), (max_long, min_lat), (max_long, max_lat), (min_long, max_lat)]
+    if polygon is not None:
+        # Smallest window containing the polygons
+        polygons = _polygon_rings(polygon)
+        return _polygon_window(polygons, geo_tie_point[0], shape), polygons
     if (location is None) or (size is None):
-        bands = [image.read(1) for image in measurement]
+        return None, None
+    return _location_window(location, size, footprint, geo_tie_point, shape), None
+
+
+def _window_meta(window, geo_tie_point, calibration_tables):
+    """Footprint, geo_tie_point and calibration_tables of a window. The tables are new dicts with the rows
+    and columns moved to the window. The arrays that are not changed are shared"""
+    (row_index_min, row_index_max), (column_index_min, column_index_max) = window
+    footprint_lat, footprint_long = get_coordinates(np.array([row_index_min, row_index_min,
+                                                              row_index_max, row_index_max]),
+                                                    np.array([column_index_min, column_index_max,
+                                                              column_index_min, column_index_max]),
+                                                    geo_tie_point[0]['latitude'], geo_tie_point[0]['longitude'],
+                                                    geo_tie_point[0]['row'], geo_tie_point[0]['column'])
+    footprint = {'latitude': footprint_lat, 'longitude': footprint_long}
+
+    window_geo_tie_point = []
+    window_calibration_tables = []
+    for geo, table in zip(geo_tie_point, calibration_tables):
+        geo = dict(geo)
+        geo['row'] = geo['row'] - row_index_min
+        geo['column'] = geo['column'] - column_index_min
+        window_geo_tie_point.append(geo)
+
+        table = dict(table)
+        table['row'] = table['row'] - row_index_min
+        table['column'] = table['column'] - column_index_min
+        if 'noise' in table:
+            table['noise'] = tools.transform_noise(table['noise'], row_index_min, 1, column_index_min, 1)
+        window_calibration_tables.append(table)
+    return footprint, window_geo_tie_point, window_calibration_tables
+
+
+def _is_slc(path):
+    """True if the measurement tiffs of the product are SLC. e.g. s1a-iw1-slc-vv-...tiff"""
+    return any(file[-4:] == 'tiff' and file.split('-')[2].upper() == 'SLC'
+               for file in os.listdir(os.path.join(path, 'measurement')))
+
+
+def _s1_load_slc(path, polarisation='all', swath='all', burst=None, workers=None, cache=None):
+    """Load the bursts of a Sentinel 1 SLC product as lazily read complex64 bands. See s1_load
+
+        Returns:
+            SarImage with a LazyBand for each burst of each sub swath and polarisation
+    """
+    meta, annotation_temp, calibration_temp = _parse_product(path, workers, cache)
+
+    # Check if polarisation and swath are given
+    if polarisation == 'all':
+        polarisation = meta['polarisation']
     else:
-        # Check location is in foot print
-        maxlat = meta['footprint']['latitude'].max()
-        minlat = meta['footprint']['latitude'].min()
-        maxlong = meta['footprint']['longitude'].max()
-        minlong = meta['footprint']['longitude'].min()
-
-        if not (minlat < location[0] < maxlat) & (minlong < location[1] < maxlong):
-            raise ValueError('Location not inside the footprint')
-
-        # get the index
-        row = np.zeros(len(geo_tie_point), dtype=int)
-        column = np.zeros(len(geo_tie_point), dtype=int)
-        for i in range(len(geo_tie_point)):
-            lat_grid = geo_tie_point[i]['latitude']
-            long_grid = geo_tie_point[i]['longitude']
-            row_grid = geo_tie_point[i]['row']
-            column_grid = geo_tie_point[i]['column']
-            row[i], column[i] = get_index_v2(location[0], location[1], lat_grid, long_grid, row_grid, column_grid)
-        # check if index are the same for all bands
-        if (abs(row.max() - row.min()) > 0.5) or (abs(column.max() - column.min()) > 0.5):
-            warnings.warn('Warning different index found for each band. First index returned')
-
-        # Find the window
-        row_index_min = row[0] - int(size[0]/2)
-        row_index_max = row[0] + int(size[0]/2)
-
-        column_index_min = column[0] - int(size[1]/2)
-        column_index_max = column[0] + int(size[1]/2)
-
-        # Check if window is in image
-        if row_index_max < 0 or column_index_max < 0:
-            raise ValueError('Error window not in image ')
-
-        if row_index_min < 0:
-            warnings.warn('Extend out of image. Window constrained ')
-            row_index_min = 0
-
-        if column_index_min < 0:
-            warnings.warn('Extend out of image. Window constrained ')
-            column_index_min = 0
-
-        for image in measurement:
-            if row_index_min > image.height or column_index_min > image.width:
-                raise ValueError('Error window not in image')
-
-            if row_index_max > image.height:
-                warnings.warn('Extend out of image. Window constrained ')
-                row_index_max = image.height
-
-            if column_index_max > image.width:
-                warnings.warn('Extend out of image. Window constrained ')
-                column_index_max = image.width
-
-        # Adjust footprint to window
-        footprint_lat = np.zeros(4)
-        footprint_long = np.zeros(4)
-        window = ((row_index_min, row_index_max), (column_index_min, column_index_max))
-
-        for i in range(2):
-            for j in range(2):
-                lat_i, long_i = get_coordinate(window[0][i], window[1][j], geo_tie_point[0]['latitude'],
-                                               geo_tie_point[0]['longitude'], geo_tie_point[0]['row'],
-                                               geo_tie_point[0]['column'])
-                footprint_lat[2 * i + j] = lat_i
-                footprint_long[2 * i + j] = long_i
-
-        meta['footprint']['latitude'] = footprint_lat
-        meta['footprint']['longitude'] = footprint_long
-
-        # Adjust geo_tie_point, calibration_tables
-        for i in range(n_bands):
-            geo_tie_point[i]['row'] = geo_tie_point[i]['row'] - row_index_min
-            geo_tie_point[i]['column'] = geo_tie_point[i]['column'] - column_index_min
+        polarisation = [elem.upper() for elem in polarisation]
+    if swath != 'all':
+        swath = [elem.upper() for elem in swath]
+    if burst is not None and np.isscalar(burst):
+        burst = [burst]
+
+    # measurement. One tiff for each sub swath and polarisation. e.g. s1a-iw1-slc-vv-...tiff
+    measurement_path = os.path.join(path, 'measurement')
+    tiff_files = []
+    for file in sorted(os.listdir(measurement_path)):
+        if file[-4:] != 'tiff':
+            continue
+        file_swath, file_polarisation = file.split('-')[1].upper(), file.split('-')[3].upper()
+        if file_polarisation in polarisation and (swath == 'all' or file_swath in swath):
+            tiff_files.append((file_swath, polarisation.index(file_polarisation), file))
+    tiff_files.sort()
+    if len(tiff_files) == 0:
+        raise ValueError('No measurement for the polarisation and swath')
+
+    with warnings.catch_warnings():  # Ignore the "NotGeoreferencedWarning" when opening the tiff
+        warnings.simplefilter("ignore")
+        measurement = tools.parallel_map(rasterio.open, [os.path.join(measurement_path, file)
+                                                         for _, _, file in tiff_files], workers)
+    burst_tables = tools.parallel_map(s1._load_bursts, [os.path.join(path, 'annotation', file[:-4] + 'xml')
+                                                        for _, _, file in tiff_files], workers)
+
+    bands = []
+    band_names = []
+    calibration_tables = []
+    geo_tie_point = []
+    band_meta = []
+    for (file_swath, index, file), dataset, bursts in zip(tiff_files, measurement, burst_tables):
+        file_polarisation = polarisation[index]
+        geo, info = [elem for elem in annotation_temp
+                     if (elem[1]['polarisation'], elem[1]['swath']) == (file_polarisation, file_swath)][0]
+        table = [elem[0] for elem in calibration_temp
+                 if (elem[1]['polarisation'], elem[1].get('swath')) == (file_polarisation, file_swath)][0]
+        if bursts is None:
+            raise ValueError('No bursts in the annotation of %s' % file)
+
+        lines_per_burst = bursts['lines_per_burst']
+        for k in range(len(bursts['azimuth_time'])) if burst is None else burst:
+            # Burst k is a block of lines in the tiff. Only this window is read
+            valid = bursts['first_valid_sample'][k] >= 0
+            valid_lines = np.flatnonzero(valid)
+            if len(valid_lines) == 0:
+                # A burst without valid lines has no data. Skipped unless it is selected
+                if burst is None:
+                    continue
+                raise ValueError('Burst %d of %s has no valid lines' % (k, file))
+
+            window = ((k * lines_per_burst, (k + 1) * lines_per_burst), (0, dataset.width))
+            _, window_geo, window_table = _window_meta(window, [geo], [table])
+
+            bands.append(LazyBand(dataset, window=window, out_dtype=np.complex64))
+            band_names.append('%s_%s_%d' % (file_swath, file_polarisation, k))
+            geo_tie_point.append(window_geo[0])
+            calibration_tables.append(window_table[0])
+            band_meta.append(dict(info, burst=k, burst_azimuth_time=bursts['azimuth_time'][k].item(),
+                                  azimuth_time_interval=bursts['azimuth_time_interval'],
+                                  first_valid_line=int(valid_lines[0]), last_valid_line=int(valid_lines[-1]),
+                                  first_valid_sample=int(bursts['first_valid_sample'][k][valid].max()),
+                                  last_valid_sample=int(bursts['last_valid_sample'][k][valid].min())))
+
+    return SarImage(bands, mission=meta['mission'], time=meta['start_time'],
+                    footprint=meta['footprint'], product_meta=meta,
+                    band_names=band_names, calibration_tables=calibration_tables,
+                    geo_tie_point=geo_tie_point, band_meta=band_meta, unit='raw complex')
+
+
+def s1_load(path, polarisation='all', location=None, size=None, lazy=False, workers=None, multilook=None,
+            out_shape=None, bbox=None, polygon=None, mask=False, cache=None, swath='all', burst=None):
+    """Function to load SAR image into SarImage python object.
+        Currently supports: unzipped Sentinel 1 GRDH and SLC products
+
+        SLC products are loaded burst by burst. Each burst of each sub swath and polarisation is a LazyBand
+        read as complex64 with the band name "<swath>_<polarisation>_<burst>" (e.g. "IW1_VV_3"). The burst
+        boundaries are from 'swathTiming' in the annotation and only the lines of a burst are read when it
+        is used. The burst and its valid lines and samples are in band_meta. Use SarImage.deburst to merge
+        the bursts of a sub swath. The selection of a window, multilook and mask are not supported for SLC
+
+        Args:
+            path(number): Path to the folder containing the SAR image
+                    as retrieved from: https://scihub.copernicus.eu/
+            polarisation(list of str): List of polarisations to load.
+            location(array/list): [latitude,longitude] Location to center the image.
+                                    If None the entire Image is loaded
+            size(array/list): [width, height] Extend of image to load.
+                                    If None the entire Image is loaded
+            lazy(bool): If True the bands are LazyBand objects that are first read from the tiff
+                                    files when they are indexed or computed on
+            workers(int or concurrent.futures.Executor): Parse, open and read the files of each polarisation
+                                    in parallel threads. If None the files are processed one at the time
+            multilook(tuple): (azimuth looks, range looks). Each pixel is the average intensity of a block of
+                                    pixels. The average is done by GDAL while reading (or from overviews of
+                                    the tiff if there are any), so the full resolution band is never in memory.
+                                    GDAL computes the averages in the integer type of the tiff, so they are
+                                    rounded to integers before they are converted to float32.
+                                    Rows and columns that do not fill a block at the end are dropped
+            out_shape(tuple): (rows, columns) Read the bands averaged to this shape. Alternative to multilook
+            bbox(array/list): [min_longitude, min_latitude, max_longitude, max_latitude] (GeoJSON order).
+                                    Load the smallest window containing the box. Alternative to location and size
+            polygon(dict or list): GeoJSON Polygon, MultiPolygon, Feature or FeatureCollection (or any object
+                                    with __geo_interface__) or a list of (longitude, latitude) vertices.
+                                    Load the smallest window containing the polygon
+            mask(bool): Set the pixels outside the polygon or bbox to 0. Not supported for lazy bands
+            cache(MetaCache or str): Cache of the parsed meta data or the folder of one. With a cache the XML
+                                    files are only parsed the first time a product is loaded
+            swath(list of str): SLC only. Sub swaths to load, e.g. ['IW1', 'IW2']. 'all' loads all sub swaths
+            burst(int or list of int): SLC only. Index of the bursts to load in each sub swath. None loads all
+                                    bursts with valid lines
+
+        Returns:
+            SarImage: object with the SAR measurements and meta data from path. Meta data index
+                    and foot print are adjusted to the window. With multilook or out_shape the bands are
+                    float32 amplitudes in memory (lazy is not used) and the indices of the meta data are
+                    adjusted to the reduced grid
 
-            calibration_tables[i]['row'] = calibration_tables[i]['row'] - row_index_min
-            calibration_tables[i]['column'] = calibration_tables[i]['column'] - column_index_min
+        Raises:
+            ValueError: Polarisation not in the product, location or polygon not in image, more than one of
+                    location, bbox and polygon is given, both multilook and out_shape are given, mask is used
+                    without a polygon or with lazy bands or a window, multilook or mask is used with a SLC
+                    product, a selected burst has no valid lines
+        """
+    if _is_slc(path):
+        if any(elem is not None for elem in (location, size, multilook, out_shape, bbox, polygon)) or mask:
+            raise ValueError('Windows, multilook and mask are not supported for SLC products. Select bursts')
+        return _s1_load_slc(path, polarisation, swath=swath, burst=burst, workers=workers, cache=cache)
+    if multilook is not None and out_shape is not None:
+        raise ValueError('Give either multilook or out_shape')
+    if mask and (polygon is None and bbox is None):
+        raise ValueError('mask requires a polygon or bbox')
+    if mask and lazy and multilook is None and out_shape is None:
+        raise ValueError('mask can not be used with lazy bands')
+
+    meta, polarisation, measurement, calibration_tables, geo_tie_point, band_meta = _open_s1(path, polarisation,
+                                                                                             workers=workers,
+                                                                                             cache=cache)
+    n_bands = len(polarisation)
+
+    window, polygons = _resolve_window((measurement[0].height, measurement[0].width), meta['footprint'],
+                                       geo_tie_point, location=location, size=size, bbox=bbox, polygon=polygon)
+
+    if window is None:
+        window = ((0, measurement[0].height), (0, measurement[0].width))
+        if multilook is None and out_shape is None:
+            if lazy:
+                bands = [LazyBand(image) for image in measurement]
+            else:
+                bands = tools.parallel_map(lambda image: image.read(1), measurement, workers)
+    else:
+        # Adjust footprint, geo_tie_point and calibration_tables to window
+        meta['footprint'], geo_tie_point, calibration_tables = _window_meta(window, geo_tie_point,
+                                                                            calibration_tables)
 
         # load the data window
-        bands = [image.read(1, window=window) for image in measurement]
+        if multilook is None and out_shape is None:
+            if lazy:
+                bands = [LazyBand(image, window=window) for image in measurement]
+            else:
+                bands = tools.parallel_map(lambda image: image.read(1, window=window), measurement, workers)
+
+    if multilook is not None or out_shape is not None:
+        (row_start, row_stop), (column_start, column_stop) = window
+        if multilook is not None:
+            # Drop the rows and columns that do not fill a block, so each pixel has exactly the given looks
+            out_shape = ((row_stop - row_start) // multilook[0], (column_stop - column_start) // multilook[1])
+            window = ((row_start, row_start + out_shape[0] * multilook[0]),
+                      (column_start, column_start + out_shape[1] * multilook[1]))
+            if window[0][1] != row_stop or window[1][1] != column_stop:
+                # Footprint of the trimmed window. The rows and columns of the tie points start at row_start
+                # and column_start
+                rows = out_shape[0] * multilook[0]
+                columns = out_shape[1] * multilook[1]
+                footprint_lat, footprint_long = get_coordinates(np.array([0, 0, rows, rows]),
+                                                                np.array([0, columns, 0, columns]),
+                                                                geo_tie_point[0]['latitude'],
+                                                                geo_tie_point[0]['longitude'],
+                                                                geo_tie_point[0]['row'], geo_tie_point[0]['column'])
+                meta['footprint'] = {'latitude': footprint_lat, 'longitude': footprint_long}
+        row_scale = (window[0][1] - window[0][0]) / out_shape[0]
+        column_scale = (window[1][1] - window[1][0]) / out_shape[1]
+
+        # Pixel i of the reduced grid is centered at row (i + 0.5) * scale - 0.5 of the window
+        for i in range(n_bands):
+            geo_tie_point[i]['row'] = (geo_tie_point[i]['row'] + 0.5) / row_scale - 0.5
+            geo_tie_point[i]['column'] = (geo_tie_point[i]['column'] + 0.5) / column_scale - 0.5
+
+            calibration_tables[i]['row'] = (calibration_tables[i]['row'] + 0.5) / row_scale - 0.5
+            calibration_tables[i]['column'] = (calibration_tables[i]['column'] + 0.5) / column_scale - 0.5
+            if 'noise' in calibration_tables[i]:
+                calibration_tables[i]['noise'] = tools.transform_noise(calibration_tables[i]['noise'],
+                                                                       (row_scale - 1) / 2, row_scale,
+                                                                       (column_scale - 1) / 2, column_scale)
+
+        bands = tools.parallel_map(lambda image: image.read(1, window=window, out_shape=tuple(out_shape),
+                                                            resampling=_MULTILOOK_RESAMPLING, out_dtype='float32'),
+                                   measurement, workers)
+
+    if mask:
+        inside = _polygon_mask(polygons, geo_tie_point[0], bands[0].shape)
+        for band in bands:
+            band[~inside] = 0
 
     return SarImage(bands, mission=meta['mission'], time=meta['start_time'],
                     footprint=meta['footprint'], product_meta=meta,
@@ -178,16 +594,129 @@ def s1_load(path, polarisation='all', location=None, size=None):
                     geo_tie_point=geo_tie_point, band_meta=band_meta, unit='raw amplitude')
 
 
-def load(path):
+def s1_calibrate(path, out, polarisation, mode='gamma', window=None, block_rows=None, dtype='float32',
+                 cache=None, db=False, noise=False):
+    """Calibrate one polarisation of a Sentinel 1 product directly from the measurement tiff.
+        The tiff is read and calibrated one block of rows at the time and the result is written to out
+        as it is calculated. Only a few blocks are kept in memory.
+
+        Args:
+            path(str): Path to the folder containing the SAR image
+                    as retrieved from: https://scihub.copernicus.eu/
+            out(str or 2d numpy array): Path of the GeoTIFF to create or a preallocated float array
+                    (e.g. numpy.memmap) with the shape of the window
+            polarisation(str): The polarisation to calibrate
+            mode(string): 'sigma_0', 'beta_0' or 'gamma'
+            window(tuple): ((row_start, row_stop), (column_start, column_stop)) window to calibrate.
+                    If None the entire image is calibrated
+            block_rows(int): Number of rows read at the time. If None a multiple of the tiff block
+                    height with roughly 4 million pixels is used
+            dtype(str): Data type of the GeoTIFF. The blocks are calibrated in this type.
+                    Only used when out is a path
+            cache(MetaCache or str): Cache of the parsed meta data or the folder of one. See s1_load
+            db(bool): Write the calibrated values in decibel (10 * log10). Done in the same pass
+            noise(bool): Remove the thermal noise in the same pass. See SarImage.remove_thermal_noise
+
+        Returns:
+            out
+
+        Raises:
+            ValueError: The polarisation is not in the product, the shape of out does not match the window or
+                    noise is True and the product has no noise vectors
+        """
+    _, polarisation, measurement, calibration_tables, _, _ = _open_s1(path, [polarisation], cache=cache)
+    image = measurement[0]
+    calibration_table = calibration_tables[0]
+
+    if window is None:
+        window = ((0, image.height), (0, image.width))
+    band = LazyBand(image, window=window)
+    rows = calibration_table['row'] - window[0][0]
+    columns = calibration_table['column'] - window[1][0]
+    noise_table = None
+    if noise:
+        if 'noise' not in calibration_table:
+            raise ValueError('The product has no noise vectors for polarisation %s' % polarisation[0])
+        noise_table = tools.transform_noise(calibration_table['noise'], window[0][0], 1, window[1][0], 1)
+
+    if block_rows is None:
+        tiff_block_rows = image.block_shapes[0][0]
+        block_rows = tiff_block_rows * max(2 ** 22 // (tiff_block_rows * band.shape[1]), 1)
+
+    if not isinstance(out, str):
+        if out.shape != band.shape:
+            raise ValueError('out has shape %s but the window has shape %s' % (str(out.shape), str(band.shape)))
+        # The blocks are calibrated directly into out
+        for _ in tools.calibration_blocks(band, rows, columns, calibration_table[mode], block_rows, out=out,
+                                         db=db, noise=noise_table):
+            pass
+        return out
+
+    blocks = tools.calibration_blocks(band, rows, columns, calibration_table[mode], block_rows, dtype=dtype, db=db,
+                                      noise=noise_table)
+
+    # Move the tie points of the tiff to the window
+    gcps, crs = image.gcps
+    gcps = [GroundControlPoint(row=gcp.row - window[0][0], col=gcp.col - window[1][0], x=gcp.x, y=gcp.y, z=gcp.z)
+            for gcp in gcps]
+    profile = {'driver': 'GTiff', 'height': band.shape[0], 'width': band.shape[1], 'count': 1, 'dtype': dtype}
+    if gcps:
+        profile.update(gcps=gcps, crs=crs)
+
+    with rasterio.open(out, 'w', **profile) as dst:
+        dst.update_tags(1, polarisation=polarisation[0], unit=mode + ' dB' if db else mode)
+        for row_start, row_end, block in blocks:
+            dst.write(block, 1, window=((row_start, row_end), (0, band.shape[1])))
+    return out
+
+
+def load(path, mmap=True, window=None):
     """ Load SarImage saved with the SarImage save method (img.save(path)).
+        Folders saved in the old pickle format are also supported.
 
         Args:
             path(str): Path to the folder where SarImage is saved.
+            mmap(bool): If True the bands are memory mapped and only read from disk when used. The bands can
+                        still be changed in place (copy on write). The saved files are not changed.
+                        Not supported for the pickle format
+            window(tuple): ((row_start, row_stop), (column_start, column_stop)) Only load this window.
+                        If None the entire image is loaded
 
         Returns:
             SarImage
         """
 
+    if os.path.exists(os.path.join(path, 'bands.pkl')):
+        image = _load_pickle(path)
+    else:
+        meta = storage.read_meta(os.path.join(path, storage.META_FILE))
+        tables = storage.read_tables(os.path.join(path, storage.TABLES_FILE))
+        bands = storage.read_bands(path, meta['n_bands'], mmap=(mmap or window is not None))
+
+        image = SarImage(bands, mission=meta['mission'], time=meta['time'],
+                         footprint=meta['footprint'], product_meta=meta['product_meta'],
+                         band_names=meta['band_names'], calibration_tables=tables['calibration_tables'],
+                         geo_tie_point=tables['geo_tie_point'], band_meta=meta['band_meta'], unit=meta['unit'])
+
+    if window is None:
+        return image
+
+    image = image[window[0][0]:window[0][1], window[1][0]:window[1][1]]
+    # Read the window from the memory mapped file
+    if not mmap:
+        image.bands = [np.array(band) for band in image.bands]
+    return image
+
+
+def _load_pickle(path):
+    """ Load SarImage saved in the pickle format.
+
+        Args:
+            path(str): Path to the folder where SarImage is saved.
+
+        Returns:
+            SarImage
+        """
     # product_meta
     file_path = os.path.join(path,'product_meta.pkl')
     product_meta = pickle.load( open( file_path, "rb" ) )
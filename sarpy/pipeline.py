@@ -0,0 +1,244 @@
+import numpy as np
+import threading
+import warnings
+import rasterio
+from rasterio.crs import CRS
+
+from .sarpy_class import SarImage, _ground_control_points
+from .lazy_band import LazyBand
+from . import tools
+from . import speckle
+
+
+class Pipeline:
+    """ Chain of operations on a SarImage that is recorded lazily and executed tile by tile.
+
+    Each tile is read with the halo needed by the filters in the chain, all operations are applied to it
+    and the result is written to the output before the next tile is read. Elementwise operations
+    (calibrate, to_db) are applied to the tile in the same pass as the filters, so no full scene
+    intermediate results are made. Peak memory is a few tiles plus the output.
+
+    Example:
+        result = Pipeline(image).calibrate('sigma_0').boxcar(5).to_db().run(tile_size=1024, workers=4)
+
+    Attributes:
+        image(SarImage): The input image. The bands can be LazyBand or numpy.memmap
+        operations(list of tuple): (name, function, halo) for each operation.
+                    function(tile, band_index, row_offset, column_offset) returns the processed tile
+        unit(str): unit of the result
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.operations = []
+        self.unit = image.unit
+
+    def __repr__(self):
+        return "Pipeline: %s" % ' -> '.join(name for name, function, halo in self.operations)
+
+    @property
+    def halo(self):
+        """Number of extra pixels needed on each side of a tile"""
+        return sum(halo for name, function, halo in self.operations)
+
+    def apply(self, function, halo=0, name='apply', unit=None):
+        """Add an operation.
+
+            Args:
+                function(callable): function(tile, band_index, row_offset, column_offset) returning the
+                            processed tile (2d numpy array with the same shape). row_offset and column_offset
+                            are the position of the tile in the image
+                halo(int): Number of pixels on each side of a pixel the function uses
+                name(str): Name of the operation
+                unit(str): unit after the operation. If None the unit is unchanged
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        self.operations.append((name, function, halo))
+        if unit is not None:
+            self.unit = unit
+        return self
+
+    def calibrate(self, mode='gamma', db=False, noise=False):
+        """Add calibration. See SarImage.calibrate
+
+            Args:
+                mode(string): 'sigma_0', 'beta_0' or 'gamma'
+                db(bool): Calibrate to decibel in one pass
+                noise(bool): Remove the thermal noise in the same pass. See SarImage.remove_thermal_noise
+
+            Returns:
+                The pipeline (Pipeline)
+
+            Raises:
+                ValueError: noise is True and the calibration tables have no noise tables
+        """
+        if 'raw' not in self.unit:
+            warnings.warn('Raw is not in units. The image have all ready been calibrated')
+        calibration_tables = self.image.calibration_tables
+        if noise and any('noise' not in table for table in calibration_tables):
+            raise ValueError('The calibration tables have no noise tables')
+
+        def calibrate_tile(tile, band_index, row_offset, column_offset):
+            table = calibration_tables[band_index]
+            noise_table = None
+            if noise:
+                noise_table = tools.transform_noise(table['noise'], row_offset, 1, column_offset, 1)
+            return tools.calibration(tile, table['row'] - row_offset, table['column'] - column_offset,
+                                     table[mode], tiles=1, db=db, noise=noise_table)
+
+        return self.apply(calibrate_tile, name='calibrate', unit=mode + ' dB' if db else mode)
+
+    def to_db(self):
+        """Add conversion to decibel. See SarImage.to_db
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        # Complex tiles are converted from the amplitude
+        factor = 20 if 'amplitude' in self.unit or 'complex' in self.unit else 10
+        unit = self.unit.replace('complex', 'amplitude') + ' dB'
+        return self.apply(lambda tile, *args: tools.to_db(tile, factor), name='to_db', unit=unit)
+
+    def boxcar(self, kernel_size, **kwargs):
+        """Add boxcar filter. See SarImage.boxcar
+
+            Args:
+                kernel_size(int): size of kernel
+                **kwargs: Additional arguments passed to tools.boxcar (method, mode, cval, origin)
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        return self.apply(lambda tile, *args: tools.boxcar(tile, kernel_size, **kwargs),
+                          halo=self._filter_halo(kernel_size, kwargs), name='boxcar')
+
+    def lee(self, size, **kwargs):
+        """Add Lee filter. See speckle.lee
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        return self.apply(lambda tile, *args: speckle.lee(tile, size, **kwargs),
+                          halo=self._filter_halo(size, kwargs), name='lee')
+
+    def enhanced_lee(self, size, **kwargs):
+        """Add enhanced Lee filter. See speckle.enhanced_lee
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        return self.apply(lambda tile, *args: speckle.enhanced_lee(tile, size, **kwargs),
+                          halo=self._filter_halo(size, kwargs), name='enhanced_lee')
+
+    def frost(self, size, **kwargs):
+        """Add Frost filter. See speckle.frost
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        return self.apply(lambda tile, *args: speckle.frost(tile, size, **kwargs),
+                          halo=self._filter_halo(size, kwargs), name='frost')
+
+    def gamma_map(self, size, **kwargs):
+        """Add Gamma-MAP filter. See speckle.gamma_map
+
+            Returns:
+                The pipeline (Pipeline)
+        """
+        return self.apply(lambda tile, *args: speckle.gamma_map(tile, size, **kwargs),
+                          halo=self._filter_halo(size, kwargs), name='gamma_map')
+
+    @staticmethod
+    def _filter_halo(size, kwargs):
+        # The border modes are only correct at the image border. wrap needs the other side of the image
+        if kwargs.get('mode') == 'wrap':
+            raise ValueError('mode "wrap" can not be used in a Pipeline')
+        origin = np.abs(np.asarray(kwargs.get('origin', 0))).max()
+        return size // 2 + int(origin)
+
+    def _tiles(self, shape, tile_size):
+        # Windows of the tiles ((row_start, row_end), (column_start, column_end))
+        return [((row_start, min(row_start + tile_size, shape[0])),
+                 (column_start, min(column_start + tile_size, shape[1])))
+                for row_start in range(0, shape[0], tile_size)
+                for column_start in range(0, shape[1], tile_size)]
+
+    def _process_tile(self, band_index, window):
+        """Read a tile with halo, apply all operations and return the tile without halo"""
+        band = self.image.bands[band_index]
+        halo = self.halo
+        (row_start, row_end), (column_start, column_end) = window
+        read_row_start = max(row_start - halo, 0)
+        read_row_end = min(row_end + halo, band.shape[0])
+        read_column_start = max(column_start - halo, 0)
+        read_column_end = min(column_end + halo, band.shape[1])
+
+        tile = np.asarray(band[read_row_start:read_row_end, read_column_start:read_column_end])
+        for name, function, operation_halo in self.operations:
+            tile = function(tile, band_index, read_row_start, read_column_start)
+
+        return tile[row_start - read_row_start:row_end - read_row_start,
+                    column_start - read_column_start:column_end - read_column_start]
+
+    def run(self, out=None, tile_size=1024, workers=None, dtype='float32'):
+        """Execute the operations tile by tile.
+
+            Args:
+                out(str or list of 2d arrays): Output sink. A list with a preallocated array (e.g. numpy.memmap)
+                            for each band, or the path of a GeoTIFF to write. If None float arrays are allocated
+                tile_size(int): size of the tiles. A multiple of 16 if out is a path
+                workers(int or concurrent.futures.Executor): Process the tiles in parallel threads.
+                            If None the tiles are processed one at the time
+                dtype(str): data type of the allocated arrays or the GeoTIFF
+
+            Returns:
+                SarImage with the result. If out is a path the bands are LazyBand of the GeoTIFF
+
+            Raises:
+                ValueError: out has the wrong number of bands or shape
+        """
+        image = self.image
+        shape = image.bands[0].shape
+        n_bands = len(image.bands)
+
+        dst = None
+        write_lock = threading.Lock()
+        if isinstance(out, str):
+            dst = rasterio.open(out, 'w', driver='GTiff', height=shape[0], width=shape[1], count=n_bands,
+                                dtype=dtype, tiled=True, blockxsize=tile_size, blockysize=tile_size,
+                                BIGTIFF='IF_SAFER', gcps=_ground_control_points(image.geo_tie_point[0]),
+                                crs=CRS.from_epsg(4326))
+        elif out is None:
+            out = [np.empty(shape, dtype=dtype) for _ in range(n_bands)]
+        elif len(out) != n_bands or any(elem.shape != shape for elem in out):
+            raise ValueError('out must contain an array with shape %s for each band' % str(shape))
+
+        def process(task):
+            band_index, window = task
+            tile = self._process_tile(band_index, window)
+            if dst is None:
+                out[band_index][window[0][0]:window[0][1], window[1][0]:window[1][1]] = tile
+            else:
+                with write_lock:
+                    dst.write(tile.astype(dtype), band_index + 1, window=window)
+
+        tasks = [(band_index, window) for band_index in range(n_bands) for window in self._tiles(shape, tile_size)]
+        try:
+            tools.parallel_map(process, tasks, workers)
+        finally:
+            if dst is not None:
+                dst.close()
+
+        if dst is not None:
+            dataset = rasterio.open(out)
+            bands = [LazyBand(dataset, band=i + 1) for i in range(n_bands)]
+        else:
+            bands = list(out)
+
+        return SarImage(bands, mission=image.mission, time=image.time,
+                        footprint=image.footprint, product_meta=image.product_meta,
+                        band_names=image.band_names, calibration_tables=image.calibration_tables,
+                        geo_tie_point=image.geo_tie_point, band_meta=image.band_meta,
+                        unit=self.unit)
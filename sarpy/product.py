@@ -0,0 +1,211 @@
+from .sarpy_class import SarImage
+from .lazy_band import LazyBand
+from . import tools
+from .load import _open_s1, _resolve_window, _window_meta, _polygon_mask
+
+
+class S1Product:
+    """ Open Sentinel 1 product. The meta data is parsed once and the measurement tiffs are kept open,
+    so many windows can be extracted without parsing and opening the product again.
+
+    Example:
+        with open_s1(path) as product:
+            chips = product.extract([{'location': [69.4, -34.5], 'size': [200, 200]},
+                                     {'bbox': [-34.8, 69.3, -34.4, 69.45]}])
+
+    Attributes:
+        path(str): Path to the folder containing the SAR image
+        meta(dict): meta data from manifest.safe
+        polarisation(list of str): The opened polarisations
+        measurement(list of rasterio datasets): open measurement tiff of each polarisation
+        calibration_tables(list of dict): calibration tables of each polarisation
+        geo_tie_point(list of dict): geo tie points of each polarisation
+        band_meta(list of dict): meta data of each polarisation
+    """
+
+    def __init__(self, path, polarisation='all', workers=None, cache=None):
+        self.path = path
+        self.meta, self.polarisation, self.measurement, self.calibration_tables, self.geo_tie_point, \
+            self.band_meta = _open_s1(path, polarisation, workers=workers, cache=cache)
+
+    def __repr__(self):
+        return "S1Product: %s %s with shape %s" % (self.meta['mission'], str(self.polarisation), str(self.shape))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def shape(self):
+        """(rows, columns) of the measurements"""
+        return self.measurement[0].height, self.measurement[0].width
+
+    def close(self):
+        """Close the measurement tiffs"""
+        for dataset in self.measurement:
+            dataset.close()
+
+    def window(self, location=None, size=None, bbox=None, polygon=None):
+        """Pixel window of a location and size, bbox or polygon. See s1_load
+            For a polygon this is the smallest window containing it. The pixels outside the polygon are
+            part of the window. Use extract with mask to set them to 0
+
+            Returns:
+                ((row_start, row_stop), (column_start, column_stop))
+
+            Raises:
+                ValueError: Location or polygon not in image or more than one of location, bbox and polygon
+                        is given
+        """
+        window, _ = _resolve_window(self.shape, self.meta['footprint'], self.geo_tie_point,
+                                    location=location, size=size, bbox=bbox, polygon=polygon)
+        if window is None:
+            window = ((0, self.shape[0]), (0, self.shape[1]))
+        return window
+
+    def extract(self, items, lazy=False, workers=None):
+        """Extract many windows as SarImages.
+
+        The windows are sorted by row and windows that overlap are merged when reading their union is not
+        larger than reading them one by one. Each merged window is read once for each band and the chips
+        are copied from it.
+
+            Args:
+                items(list): Windows to extract. Each item is either a pixel window
+                        ((row_start, row_stop), (column_start, column_stop)) or a dict with the keyword
+                        arguments of s1_load that select a window: location and size, bbox or polygon,
+                        and optionally mask
+                lazy(bool): If True the bands of the chips are LazyBand objects of the open tiffs.
+                        Masking is not supported for lazy bands
+                workers(int or concurrent.futures.Executor): Read the merged windows in parallel threads
+
+            Returns:
+                list of SarImage in the order of items
+
+            Raises:
+                ValueError: A location or polygon is not in the image, an item gives more than one of location,
+                        bbox and polygon, a pixel window is not inside the image or mask is used with lazy
+        """
+        windows = []
+        masks = []
+        for item in items:
+            if isinstance(item, dict):
+                selection = {key: value for key, value in item.items() if key != 'mask'}
+                window, polygons = _resolve_window(self.shape, self.meta['footprint'], self.geo_tie_point,
+                                                   **selection)
+                if window is None:
+                    window = ((0, self.shape[0]), (0, self.shape[1]))
+                if item.get('mask', False):
+                    if polygons is None:
+                        raise ValueError('mask requires a polygon or bbox')
+                    if lazy:
+                        raise ValueError('mask can not be used with lazy bands')
+                    masks.append(polygons)
+                else:
+                    masks.append(None)
+            else:
+                window = tuple(tuple(int(elem) for elem in axis) for axis in item)
+                for (start, stop), n in zip(window, self.shape):
+                    if not 0 <= start < stop <= n:
+                        raise ValueError('Window %s is not inside the image with shape %s'
+                                         % (str(window), str(self.shape)))
+                masks.append(None)
+            windows.append(window)
+
+        if lazy:
+            chip_bands = [[LazyBand(dataset, window=window) for dataset in self.measurement] for window in windows]
+        else:
+            chip_bands = self._read_coalesced(windows, workers)
+
+        chips = []
+        for window, bands, polygons in zip(windows, chip_bands, masks):
+            footprint, geo_tie_point, calibration_tables = _window_meta(window, self.geo_tie_point,
+                                                                        self.calibration_tables)
+            if polygons is not None:
+                inside = _polygon_mask(polygons, geo_tie_point[0], bands[0].shape)
+                for band in bands:
+                    band[~inside] = 0
+
+            product_meta = dict(self.meta, footprint=footprint)
+            chips.append(SarImage(bands, mission=self.meta['mission'], time=self.meta['start_time'],
+                                  footprint=footprint, product_meta=product_meta,
+                                  band_names=self.polarisation, calibration_tables=calibration_tables,
+                                  geo_tie_point=geo_tie_point, band_meta=self.band_meta, unit='raw amplitude'))
+        return chips
+
+    def _read_coalesced(self, windows, workers=None):
+        """Read the windows of all bands. Overlapping windows are read once. Returns the bands of each window"""
+        groups = _coalesce(windows)
+
+        def read_group(task):
+            union, dataset = task
+            (row_start, row_stop), (column_start, column_stop) = union
+            return LazyBand(dataset)[row_start:row_stop, column_start:column_stop]
+
+        tasks = [(union, dataset) for union, members in groups for dataset in self.measurement]
+        blocks = tools.parallel_map(read_group, tasks, workers)
+
+        n_bands = len(self.measurement)
+        chip_bands = [None] * len(windows)
+        for group_index, (union, members) in enumerate(groups):
+            group_blocks = blocks[group_index * n_bands:(group_index + 1) * n_bands]
+            for index in members:
+                (row_start, row_stop), (column_start, column_stop) = windows[index]
+                rows = slice(row_start - union[0][0], row_stop - union[0][0])
+                columns = slice(column_start - union[1][0], column_stop - union[1][0])
+                # Copies, so the chips do not share memory
+                chip_bands[index] = [block[rows, columns].copy() for block in group_blocks]
+        return chip_bands
+
+
+def _area(window):
+    return (window[0][1] - window[0][0]) * (window[1][1] - window[1][0])
+
+
+def _union(window_a, window_b):
+    return ((min(window_a[0][0], window_b[0][0]), max(window_a[0][1], window_b[0][1])),
+            (min(window_a[1][0], window_b[1][0]), max(window_a[1][1], window_b[1][1])))
+
+
+def _coalesce(windows):
+    """Merge overlapping windows when reading the union is not more than reading them separately.
+
+        Args:
+            windows(list of tuple): ((row_start, row_stop), (column_start, column_stop)) windows
+
+        Returns:
+            list of (union window, list of indices of the windows in the union) sorted by row
+    """
+    groups = []
+    for index in sorted(range(len(windows)), key=lambda i: (windows[i][0][0], windows[i][1][0])):
+        window = windows[index]
+        for group in groups:
+            union, members = group
+            overlap = (window[0][0] < union[0][1] and union[0][0] < window[0][1] and
+                       window[1][0] < union[1][1] and union[1][0] < window[1][1])
+            merged = _union(union, window)
+            if overlap and _area(merged) <= _area(union) + _area(window):
+                group[0] = merged
+                members.append(index)
+                break
+        else:
+            groups.append([window, [index]])
+    return [(union, members) for union, members in groups]
+
+
+def open_s1(path, polarisation='all', workers=None, cache=None):
+    """Open a Sentinel 1 product to extract many windows from it. See S1Product.
+        Currently supports: unzipped Sentinel 1 GRDH products
+
+        Args:
+            path(str): Path to the folder containing the SAR image
+            polarisation(list of str): List of polarisations to open. 'all' opens all polarisations
+            workers(int or concurrent.futures.Executor): Parse and open the files in parallel threads
+            cache(MetaCache or str): Cache of the parsed meta data or the folder of one. See s1_load
+
+        Returns:
+            S1Product
+    """
+    return S1Product(path, polarisation=polarisation, workers=workers, cache=cache)
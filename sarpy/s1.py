@@ -1,10 +1,38 @@
-
 import numpy as np
-import xml.etree.ElementTree
 import warnings
 import datetime
 import lxml.etree
 
+
+def _xml_array(element, path, dtype):
+    """Convert the text of all elements at path to one numpy array.
+    The text of the elements is joined and converted in one call instead of element by element.
+
+    Args:
+        element(lxml element): element to search from
+        path(str): xpath of the elements. e.g. 'calibrationVector/sigmaNought'
+        dtype: int or float
+
+    Returns:
+        1d numpy array with the values of all elements
+    """
+    return np.fromstring(' '.join(element.xpath(path + '/text()')), dtype=dtype, sep=' ')
+
+
+def _load_ads_header(root):
+    """Meta data in 'adsHeader' as dictionary {child.tag: child.text}. None if not found"""
+    info_xml = root.findall('adsHeader')
+    if len(info_xml) == 1:
+        info = {}
+        for child in info_xml[0]:
+            if isinstance(child.tag, str):  # Skip comments
+                info[child.tag] = child.text
+    else:
+        warnings.warn('Warning adsHeader not found')
+        info = None
+    return info
+
+
 def _load_calibration(path):
     """Load sentinel 1 calibration_table file as dictionary from PATH.
 
@@ -31,18 +59,10 @@ def _load_calibration(path):
              ...}
     """
     # open xml file
-    tree = xml.etree.ElementTree.parse(path)
-    root = tree.getroot()
+    root = lxml.etree.parse(path).getroot()
 
     # Find info
-    info_xml = root.findall('adsHeader')
-    if len(info_xml) == 1:
-        info = {}
-        for child in info_xml[0]:
-            info[child.tag] = child.text
-    else:
-        warnings.warn('Warning adsHeader not found')
-        info = None
+    info = _load_ads_header(root)
 
     # Find calibration_table list
     cal_vectors = root.findall('calibrationVectorList')
@@ -52,31 +72,26 @@ def _load_calibration(path):
         warnings.warn('Error loading calibration_table list')
         return None, info
 
-    # get pixels from first vector
-    pixel = np.array(list(map(int, cal_vectors[0][2].text.split())))
-    # initialize arrays
-    azimuth_time = np.empty([len(cal_vectors),len(pixel)], dtype='datetime64[us]')
-    line = np.empty([len(cal_vectors)], dtype=int)
-    sigma_0 = np.empty([len(cal_vectors),len(pixel)], dtype=float)
-    beta_0 = np.empty([len(cal_vectors),len(pixel)], dtype=float)
-    gamma = np.empty([len(cal_vectors),len(pixel)], dtype=float)
-    dn = np.empty([len(cal_vectors),len(pixel)], dtype=float)
-
-    # get data
-    for i, cal_vec in enumerate(cal_vectors):
-        pixel_i = np.array(list(map(int, cal_vec[2].text.split())))
-        if not np.array_equal(pixel,pixel_i):
+    # get data. All vectors of a kind are converted in one go
+    n_vectors = len(cal_vectors.findall('calibrationVector'))
+    pixel_text = [text.strip() for text in cal_vectors.xpath('calibrationVector/pixel/text()')]
+    pixel = np.fromstring(pixel_text[0], dtype=int, sep=' ')
+    # Only convert the pixels of the other vectors if the text differs from the first
+    if any(text != pixel_text[0] for text in pixel_text[1:]):
+        pixels = _xml_array(cal_vectors, 'calibrationVector/pixel', int)
+        if (len(pixels) != n_vectors * len(pixel)) or not (pixels.reshape(n_vectors, -1) == pixel).all():
             warnings.warn('Warning in _load_calibration. The calibration_table data is not on a proper grid')
-        azimuth_time[i,:] = np.datetime64(cal_vec[0].text)
-        line[i] = int(cal_vec[1].text)
-        sigma_0[i,:] = np.array(list(map(float, cal_vec[3].text.split())))
-        beta_0[i,:] = np.array(list(map(float, cal_vec[4].text.split())))
-        gamma[i,:] = np.array(list(map(float, cal_vec[5].text.split())))
-        dn[i,:] = np.array(list(map(float, cal_vec[6].text.split())))
+    azimuth_time = np.array(cal_vectors.xpath('calibrationVector/azimuthTime/text()'), dtype='datetime64[us]')
+    azimuth_time = np.repeat(azimuth_time[:, np.newaxis], len(pixel), axis=1)
+    line = _xml_array(cal_vectors, 'calibrationVector/line', int)
+    sigma_0 = _xml_array(cal_vectors, 'calibrationVector/sigmaNought', float).reshape(n_vectors, -1)
+    beta_0 = _xml_array(cal_vectors, 'calibrationVector/betaNought', float).reshape(n_vectors, -1)
+    gamma = _xml_array(cal_vectors, 'calibrationVector/gamma', float).reshape(n_vectors, -1)
+    dn = _xml_array(cal_vectors, 'calibrationVector/dn', float).reshape(n_vectors, -1)
 
     # Combine calibration_table info
     calibration_table = {
-        "abs_calibration_const": float(root[1][0].text),
+        "abs_calibration_const": float(root.findtext('calibrationInformation/absoluteCalibrationConstant')),
         "row": line,
         "column": pixel,
         "azimuth_time": azimuth_time,
@@ -89,6 +104,94 @@ def _load_calibration(path):
     return calibration_table, info
 
 
+def _load_noise(path):
+    """Load sentinel 1 noise file as dictionary from PATH.
+
+    The noise file should be as included in .SAFE format
+    retrieved from: https://scihub.copernicus.eu/
+    Products from IPF 2.9 have range noise vectors and azimuth noise vectors for blocks of each sub swath.
+    Older products only have range noise vectors and the azimuth noise is 1.
+
+    The range vectors do not need to have the same pixels. All vectors are interpolated to the pixels of all
+    vectors, so the range noise is a grid like the calibration tables.
+
+    Args:
+        path: The path to the noise file
+
+    Returns:
+        noise_table: A dictionary with the noise vectors
+            {"row": np.array(int),
+            "column": np.array(int),
+            "range": np.array(float) with shape (len(row), len(column)),
+            "azimuth": [{"swath": str,
+                         "row_min": float, "row_max": float,
+                         "column_min": float, "column_max": float,
+                         "row": np.array(int),
+                         "values": np.array(float)}, ...]}
+            row_min, row_max, column_min and column_max are the edges of the pixels of the block, e.g.
+            row_min = firstAzimuthLine - 0.5 and row_max = lastAzimuthLine + 0.5
+
+        info: A dictionary with the meta data given in 'adsHeader'
+            {child[0].tag: child[0].text,
+             child[1].tag: child[1].text,
+             ...}
+    """
+    # open xml file
+    root = lxml.etree.parse(path).getroot()
+
+    # Find info
+    info = _load_ads_header(root)
+
+    # Range vectors. noiseVectorList before IPF 2.9
+    if root.find('noiseRangeVectorList') is not None:
+        range_vectors = root.find('noiseRangeVectorList')
+        vector_tag, lut_tag = 'noiseRangeVector', 'noiseRangeLut'
+    elif root.find('noiseVectorList') is not None:
+        range_vectors = root.find('noiseVectorList')
+        vector_tag, lut_tag = 'noiseVector', 'noiseLut'
+    else:
+        warnings.warn('Error loading noise vector list')
+        return None, info
+
+    line = _xml_array(range_vectors, vector_tag + '/line', int)
+    pixel_text = [text.strip() for text in range_vectors.xpath(vector_tag + '/pixel/text()')]
+    lut = _xml_array(range_vectors, vector_tag + '/' + lut_tag, float)
+    if all(text == pixel_text[0] for text in pixel_text[1:]):
+        pixel = np.fromstring(pixel_text[0], dtype=int, sep=' ')
+        range_noise = lut.reshape(len(line), -1)
+    else:
+        # Interpolate each vector to the pixels of all vectors
+        pixels = [np.fromstring(text, dtype=int, sep=' ') for text in pixel_text]
+        pixel = np.unique(np.concatenate(pixels))
+        range_noise = np.empty((len(line), len(pixel)))
+        ends = np.cumsum([len(elem) for elem in pixels])
+        for i, (vector_pixel, vector_lut) in enumerate(zip(pixels, np.split(lut, ends[:-1]))):
+            range_noise[i] = np.interp(pixel, vector_pixel, vector_lut)
+
+    # Azimuth vectors of each block
+    azimuth = []
+    for vector in root.xpath('noiseAzimuthVectorList/noiseAzimuthVector'):
+        azimuth.append({
+            "swath": vector.findtext('swath'),
+            "row_min": int(vector.findtext('firstAzimuthLine')) - 0.5,
+            "row_max": int(vector.findtext('lastAzimuthLine')) + 0.5,
+            "column_min": int(vector.findtext('firstRangeSample')) - 0.5,
+            "column_max": int(vector.findtext('lastRangeSample')) + 0.5,
+            "row": np.fromstring(vector.findtext('line'), dtype=int, sep=' '),
+            "values": np.fromstring(vector.findtext('noiseAzimuthLut'), dtype=float, sep=' '),
+        })
+
+    # Combine noise info
+    noise_table = {
+        "row": line,
+        "column": pixel,
+        "range": range_noise,
+        "azimuth": azimuth,
+    }
+
+    return noise_table, info
+
+
 def _load_meta(SAFE_path):
     """Load manifest.safe as dictionary from SAFE_path.
 
@@ -384,52 +487,29 @@ def _load_annotation(path):
      """
 
     # open xml file
-    tree = xml.etree.ElementTree.parse(path)
-    root = tree.getroot()
+    root = lxml.etree.parse(path).getroot()
 
     # Find info
-    info_xml = root.findall('adsHeader')
-    if len(info_xml) == 1:
-        info = {}
-        for child in info_xml[0]:
-            info[child.tag] = child.text
-    else:
-        warnings.warn('Warning adsHeader not found')
-        info = None
+    info = _load_ads_header(root)
 
     # Find geo location list
     geo_points = root.findall('geolocationGrid')
     if len(geo_points) == 1:
-        geo_points = geo_points[0][0]
+        geo_points = geo_points[0].find('geolocationGridPointList')
     else:
         warnings.warn('Warning geolocationGrid not found')
         return None, None
 
-    # initialize arrays
-    n_points = len(geo_points)
-    azimuth_time = np.empty(n_points, dtype='datetime64[us]')
-    slant_range_time = np.zeros(n_points, dtype=float)
-    line = np.zeros(n_points, dtype=int)
-    pixel = np.zeros(n_points, dtype=int)
-    latitude = np.zeros(n_points, dtype=float)
-    longitude = np.zeros(n_points, dtype=float)
-    height = np.zeros(n_points, dtype=float)
-    incidence_angle = np.zeros(n_points, dtype=float)
-    elevation_angle = np.zeros(n_points, dtype=float)
-
-    # get the data
-    for i in range(0, n_points):
-        point = geo_points[i]
-
-        azimuth_time[i] = np.datetime64(point[0].text)
-        slant_range_time[i] = float(point[1].text)
-        line[i] = int(point[2].text)
-        pixel[i] = int(point[3].text)
-        latitude[i] = float(point[4].text)
-        longitude[i] = float(point[5].text)
-        height[i] = float(point[6].text)
-        incidence_angle[i] = float(point[7].text)
-        elevation_angle[i] = float(point[8].text)
+    # get the data. All points are converted in one go
+    azimuth_time = np.array(geo_points.xpath('geolocationGridPoint/azimuthTime/text()'), dtype='datetime64[us]')
+    slant_range_time = _xml_array(geo_points, 'geolocationGridPoint/slantRangeTime', float)
+    line = _xml_array(geo_points, 'geolocationGridPoint/line', int)
+    pixel = _xml_array(geo_points, 'geolocationGridPoint/pixel', int)
+    latitude = _xml_array(geo_points, 'geolocationGridPoint/latitude', float)
+    longitude = _xml_array(geo_points, 'geolocationGridPoint/longitude', float)
+    height = _xml_array(geo_points, 'geolocationGridPoint/height', float)
+    incidence_angle = _xml_array(geo_points, 'geolocationGridPoint/incidenceAngle', float)
+    elevation_angle = _xml_array(geo_points, 'geolocationGridPoint/elevationAngle', float)
 
     # Combine geo_locations info
     geo_locations = {
@@ -445,3 +525,46 @@ def _load_annotation(path):
     }
 
     return geo_locations, info
+
+
+def _load_bursts(path):
+    """Load the bursts of a sentinel 1 SLC sub swath from the 'swathTiming' of the annotation file at PATH.
+
+    The annotation file should be as included in .SAFE format
+    retrieved from: https://scihub.copernicus.eu/
+    The bursts are stored one after the other in the measurement tiff. Burst k is the lines
+    k * lines_per_burst to (k + 1) * lines_per_burst.
+
+    Args:
+        path: The path to the annotation file
+
+    Returns:
+        burst_table: A dictionary with the bursts. None if the product has no bursts (e.g. GRD)
+            {"lines_per_burst": int,
+            "samples_per_burst": int,
+            "azimuth_time_interval": float,
+            "azimuth_time": np.array(datetime64[us]),
+            "first_valid_sample": np.array(int) with shape (bursts, lines_per_burst),
+            "last_valid_sample": np.array(int) with shape (bursts, lines_per_burst)}
+            The valid samples are -1 for lines that are not valid
+    """
+    # open xml file
+    root = lxml.etree.parse(path).getroot()
+
+    swath_timing = root.find('swathTiming')
+    if swath_timing is None or len(swath_timing.findall('burstList/burst')) == 0:
+        return None
+    bursts = swath_timing.find('burstList')
+    n_bursts = len(bursts.findall('burst'))
+
+    # Combine burst info
+    burst_table = {
+        "lines_per_burst": int(swath_timing.findtext('linesPerBurst')),
+        "samples_per_burst": int(swath_timing.findtext('samplesPerBurst')),
+        "azimuth_time_interval": float(root.findtext('imageAnnotation/imageInformation/azimuthTimeInterval')),
+        "azimuth_time": np.array(bursts.xpath('burst/azimuthTime/text()'), dtype='datetime64[us]'),
+        "first_valid_sample": _xml_array(bursts, 'burst/firstValidSample', int).reshape(n_bursts, -1),
+        "last_valid_sample": _xml_array(bursts, 'burst/lastValidSample', int).reshape(n_bursts, -1),
+    }
+
+    return burst_table
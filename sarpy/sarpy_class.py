@@ -1,20 +1,37 @@
 import numpy as np
-import copy
 import os
 import pickle
+import tempfile
 import warnings
 import matplotlib.pyplot as plt
+import rasterio
+import rasterio.shutil
+from rasterio.control import GroundControlPoint
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
 from . import get_functions
 from . import tools
+from . import speckle
+from . import storage
+from . import tiles
+from . import slc
 
 # TODO: Decide the amount of checking and control in the class
 
 
+def _ground_control_points(geo_tie_point):
+    """Geo tie points of a band as rasterio ground control points (x=longitude, y=latitude, z=height)"""
+    return [GroundControlPoint(row=row, col=column, x=long, y=lat, z=height)
+            for row, column, lat, long, height in zip(geo_tie_point['row'], geo_tie_point['column'],
+                                                      geo_tie_point['latitude'], geo_tie_point['longitude'],
+                                                      geo_tie_point['height'])]
+
+
 class SarImage:
     """ Class to contain SAR image, relevant meta data and methods.
 
     Attributes:
-        bands(list of numpy arrays): The measurements.
+        bands(list of numpy arrays): The measurements. A band can also be a LazyBand that is read when used.
         mission(str): Mission name:
         time(datetime): start time of acquisition
         footprint(dict): dictionary with footprint of image
@@ -41,7 +58,12 @@ class SarImage:
         self.geo_tie_point = geo_tie_point
         self.band_meta = band_meta
         self.unit = unit
-        # Note that SlC is in strips. Maybe load as list of images
+        # SLC is loaded with a band for each burst. See s1_load and deburst
+
+        # Triangulations of the geo tie points. Build when needed by _triangulation
+        self._triangulation_cache = {}
+        # Geo tie points of the image this image is a slice of and the transform of the indices. See _geo_frame
+        self._geo_frames = None
 
     def __repr__(self):
         return "Mission: %s \n Bands: %s" % (self.mission, str(self.band_names))
@@ -85,101 +107,214 @@ class SarImage:
         if column_stop is None:
             column_stop = self.bands[0].shape[1]
 
-        # Adjust footprint to window
-        footprint_lat = np.zeros(4)
-        footprint_long = np.zeros(4)
-
-        window = ((row_start, row_stop), (column_start, column_stop))
-
-        for i in range(2):
-            for j in range(2):
-                lat_i, long_i = self.get_coordinate(window[0][i], window[1][j])
-                footprint_lat[2 * i + j] = lat_i
-                footprint_long[2 * i + j] = long_i
+        # Adjust footprint to window. All four corners in one call
+        footprint_lat, footprint_long = self.get_coordinate(np.array([row_start, row_start, row_stop, row_stop]),
+                                                            np.array([column_start, column_stop,
+                                                                      column_start, column_stop]))
 
         footprint = {'latitude': footprint_lat, 'longitude': footprint_long}
 
-        # Adjust geo_tie_point, calibration_tables
-        n_bands = len(self.bands)
-        geo_tie_point = copy.deepcopy(self.geo_tie_point)
-        calibration_tables = copy.deepcopy(self.calibration_tables)
-        for i in range(n_bands):
-            geo_tie_point[i]['row'] = (geo_tie_point[i]['row'] - row_start)/row_step
-            geo_tie_point[i]['column'] = (geo_tie_point[i]['column'] - column_start)/column_step
-
-            calibration_tables[i]['row'] = (calibration_tables[i]['row'] - row_start)/row_step
-            calibration_tables[i]['column'] = (calibration_tables[i]['column'] - column_start)/column_step
+        # Adjust geo_tie_point, calibration_tables. Only the row and column arrays are new
+        geo_tie_point, calibration_tables = self._transformed_tables(row_start, row_step, column_start, column_step)
 
         # slice the bands
         bands = [band[key] for band in self.bands]
 
-        return SarImage(bands, mission=self.mission, time=self.time,
-                        footprint=footprint, product_meta=self.product_meta,
-                        band_names=self.band_names, calibration_tables=calibration_tables,
-                        geo_tie_point=geo_tie_point, band_meta=self.band_meta)
+        image = SarImage(bands, mission=self.mission, time=self.time,
+                         footprint=footprint, product_meta=self.product_meta,
+                         band_names=self.band_names, calibration_tables=calibration_tables,
+                         geo_tie_point=geo_tie_point, band_meta=self.band_meta, unit=self.unit)
+        self._share_geolocation(image, row_start, row_step, column_start, column_step)
+        return image
 
     def get_index(self, lat, long):
-        """Get index of a location by interpolating grid-points
+        """Get index of a location by interpolating grid-points. Consistent with get_coordinate.
+        lat and long can be arrays to get the indices of many locations at once.
 
         Args:
-            lat(number): Latitude of the location
-            long(number): Longitude of location
+            lat(number or numpy array): Latitude of the location
+            long(number or numpy array): Longitude of location
 
         Returns:
-            row(int): The row index of the location
-            column(int): The column index of the location
+            row(int or numpy array of int): The row index of the location
+            column(int or numpy array of int): The column index of the location
 
         Raises:
         """
-        geo_tie_point = self.geo_tie_point
-        row = np.zeros(len(geo_tie_point), dtype=int)
-        column = np.zeros(len(geo_tie_point), dtype=int)
+        row = []
+        column = []
 
         # find index for each band
-        for i in range(len(geo_tie_point)):
-            lat_grid = geo_tie_point[i]['latitude']
-            long_grid = geo_tie_point[i]['longitude']
-            row_grid = geo_tie_point[i]['row']
-            column_grid = geo_tie_point[i]['column']
-            row[i], column[i] = get_functions.get_index_v2(lat, long, lat_grid, long_grid, row_grid, column_grid)
+        for i in range(len(self.geo_tie_point)):
+            geo_tie_point, row_start, row_step, column_start, column_step = self._geo_frame(i)
+            row_i, column_i = get_functions.get_indices_v2(lat, long, geo_tie_point['latitude'],
+                                                           geo_tie_point['longitude'], geo_tie_point['row'],
+                                                           geo_tie_point['column'],
+                                                           triangulation=self._triangulation(i, 'coordinate'),
+                                                           index_triangulation=self._triangulation(i, 'index'))
+            row.append(np.round((row_i - row_start) / row_step).astype(int))
+            column.append(np.round((column_i - column_start) / column_step).astype(int))
+        row = np.array(row)
+        column = np.array(column)
 
         # check that the results are the same
-        if (abs(row.max() - row.min()) > 0.5) or (abs(column.max() - column.min()) > 0.5):
+        if (np.abs(row.max(axis=0) - row.min(axis=0)).max() > 0.5) or \
+                (np.abs(column.max(axis=0) - column.min(axis=0)).max() > 0.5):
             warnings.warn('Warning different index found for each band. First index returned')
 
         return row[0], column[0]
 
     def get_coordinate(self, row, column):
-        """Get coordinate from index by interpolating grid-points
+        """Get coordinate from index by interpolating grid-points.
+        row and column can be arrays to get the coordinates of many positions at once.
 
             Args:
-                row(number): index of the row of interest position
-                column(number): index of the column of interest position
+                row(number or numpy array): index of the row of interest position
+                column(number or numpy array): index of the column of interest position
 
             Returns:
-                lat(float): Latitude of the position
-                long(float): longitude of the position
+                lat(float or numpy array): Latitude of the position
+                long(float or numpy array): longitude of the position
 
             Raises:
             """
 
-        geo_tie_point = self.geo_tie_point
-        lat = np.zeros(len(geo_tie_point), dtype=float)
-        long = np.zeros(len(geo_tie_point), dtype=float)
+        lat = []
+        long = []
 
         # find index for each band
-        for i in range(len(geo_tie_point)):
-            lat_grid = geo_tie_point[i]['latitude']
-            long_grid = geo_tie_point[i]['longitude']
-            row_grid = geo_tie_point[i]['row']
-            column_grid = geo_tie_point[i]['column']
-            lat[i], long[i] = get_functions.get_coordinate(row, column, lat_grid, long_grid, row_grid, column_grid)
+        for i in range(len(self.geo_tie_point)):
+            geo_tie_point, row_start, row_step, column_start, column_step = self._geo_frame(i)
+            lat_i, long_i = get_functions.get_coordinates(row_start + row_step * np.asarray(row),
+                                                          column_start + column_step * np.asarray(column),
+                                                          geo_tie_point['latitude'], geo_tie_point['longitude'],
+                                                          geo_tie_point['row'], geo_tie_point['column'],
+                                                          triangulation=self._triangulation(i, 'coordinate'))
+            lat.append(lat_i)
+            long.append(long_i)
+        lat = np.array(lat)
+        long = np.array(long)
 
         # check that the results are the same
-        if (abs(lat.max() - lat.min()) > 0.001) or (abs(long.max() - long.min()) > 0.001):
+        with warnings.catch_warnings():  # All nan outside the grid
+            warnings.simplefilter("ignore", RuntimeWarning)
+            lat_difference = np.nanmax(lat.max(axis=0) - lat.min(axis=0))
+            long_difference = np.nanmax(long.max(axis=0) - long.min(axis=0))
+        if (lat_difference > 0.001) or (long_difference > 0.001):
             warnings.warn('Warning different coordinates found for each band. Mean returned')
 
-        return lat.mean(), long.mean()
+        return lat.mean(axis=0), long.mean(axis=0)
+
+    def get_geo_raster(self, key='latitude', band_index=0, stride=1, out=None, dtype=float, block_rows=1024):
+        """Raster of a geo tie point value (e.g. latitude) for every pixel in the image.
+        The regular grid of tie points is interpolated bilinear and separable (first along the columns once,
+        then along the rows one block at the time).
+
+            Args:
+                key(str): 'latitude', 'longitude', 'height', 'incidence_angle', 'elevation_angle'
+                            or 'slant_range_time'
+                band_index(int): index of the band whose tie points are used
+                stride(int): Only calculate every stride pixel. Gives a decimated raster
+                out(2d numpy array): Preallocated array (e.g. numpy.memmap) to write the raster in.
+                            Must have the shape of self.bands[band_index][::stride, ::stride]
+                dtype(numpy dtype): dtype of the raster if out is None
+                block_rows(int): number of rows calculated at the time
+
+            Returns:
+                raster(2d numpy array)
+
+            Raises:
+                ValueError: out has the wrong shape or the tie points are not on a regular grid
+            """
+        rows, columns, values = get_functions.tie_point_grid(self.geo_tie_point[band_index], key)
+        n_rows, n_columns = self.bands[band_index].shape
+        row_index = np.arange(0, n_rows, stride)
+        column_index = np.arange(0, n_columns, stride)
+
+        if out is None:
+            out = np.empty((len(row_index), len(column_index)), dtype=dtype)
+        elif out.shape != (len(row_index), len(column_index)):
+            raise ValueError('out must have shape %s' % str((len(row_index), len(column_index))))
+
+        # Interpolate the columns once for every row in the grid
+        column_values = tools.interpolate_columns(columns, values, column_index)
+        for row_start in range(0, len(row_index), block_rows):
+            row_end = min(row_start + block_rows, len(row_index))
+            out[row_start:row_end, :] = tools.interpolate_rows(rows, column_values, row_index[row_start:row_end])
+        return out
+
+    def _geo_frame(self, index):
+        """Geo tie points used to geolocate band at index and the transform from the indices of this image
+        to the indices of the tie points: tie point row = row_start + row_step * row (same for columns).
+
+        Slices share the tie points and triangulations of the image they are sliced from. If the row or column
+        array of geo_tie_point has been replaced, the tie points of this image are used.
+
+        Returns:
+            geo_tie_point(dict), row_start, row_step, column_start, column_step
+        """
+        if self._geo_frames is not None:
+            geo_tie_point, row_start, row_step, column_start, column_step, row, column = self._geo_frames[index]
+            if self.geo_tie_point[index]['row'] is row and self.geo_tie_point[index]['column'] is column:
+                return geo_tie_point, row_start, row_step, column_start, column_step
+        return self.geo_tie_point[index], 0, 1, 0, 1
+
+    def _transformed_tables(self, row_start, row_step, column_start, column_step):
+        """geo_tie_point and calibration_tables with the indices transformed to new = (old - start) / step.
+        The dicts are new but all arrays except row and column are shared"""
+        geo_tie_point = []
+        calibration_tables = []
+        for geo, table in zip(self.geo_tie_point, self.calibration_tables):
+            geo = dict(geo)
+            geo['row'] = (geo['row'] - row_start) / row_step
+            geo['column'] = (geo['column'] - column_start) / column_step
+            geo_tie_point.append(geo)
+
+            table = dict(table)
+            table['row'] = (table['row'] - row_start) / row_step
+            table['column'] = (table['column'] - column_start) / column_step
+            if 'noise' in table:
+                table['noise'] = tools.transform_noise(table['noise'], row_start, row_step, column_start, column_step)
+            calibration_tables.append(table)
+        return geo_tie_point, calibration_tables
+
+    def _share_geolocation(self, image, row_start, row_step, column_start, column_step):
+        """Let image, whose pixel (row, column) is pixel (row_start + row_step * row, ...) of this image, use the
+        tie points and triangulations of this image, so they are not triangulated again"""
+        frames = []
+        for i in range(len(self.geo_tie_point)):
+            geo_tie_point, start_i, step_i, column_start_i, column_step_i = self._geo_frame(i)
+            frames.append((geo_tie_point, start_i + step_i * row_start, step_i * row_step,
+                           column_start_i + column_step_i * column_start, column_step_i * column_step,
+                           image.geo_tie_point[i]['row'], image.geo_tie_point[i]['column']))
+        image._geo_frames = frames
+        image._triangulation_cache = self._triangulation_cache
+
+    def _triangulation(self, index, kind):
+        """Cached triangulation of the geo tie points of band at index (see _geo_frame).
+
+        The tie points are treated as immutable. Assigning new arrays to geo_tie_point gives a new triangulation
+        but changing the arrays in place does not.
+
+        Args:
+            index(int): index of the band
+            kind(str): 'coordinate' for triangulation of (row, column) used to find coordinates.
+                        'index' for triangulation of (latitude, longitude) used to find indices
+
+        Returns:
+            triangulation(scipy.spatial.Delaunay)
+        """
+        geo_tie_point = self._geo_frame(index)[0]
+        if kind == 'coordinate':
+            arrays = (geo_tie_point['row'], geo_tie_point['column'])
+        else:
+            arrays = (geo_tie_point['latitude'], geo_tie_point['longitude'])
+
+        key = (kind, id(arrays[0]), id(arrays[1]))
+        # The arrays are kept in the cache, so the ids are not reused by other arrays
+        if key not in self._triangulation_cache:
+            self._triangulation_cache[key] = (arrays, get_functions.get_triangulation(*arrays))
+        return self._triangulation_cache[key][1]
 
     def simple_plot(self, band_index=0, q_max=0.95, stride=1, **kwargs):
         """ Makes a simple image of band and a color bar.
@@ -195,71 +330,165 @@ class SarImage:
 
             Raises:
             """
-        v_max = np.quantile(self.bands[band_index].reshape(-1), q_max)
+        band = np.asarray(self.bands[band_index])
+        v_max = np.quantile(band.reshape(-1), q_max)
 
-        plt.imshow(self.bands[band_index][::stride, ::stride], vmax=v_max, **kwargs)
+        plt.imshow(band[::stride, ::stride], vmax=v_max, **kwargs)
         plt.colorbar()
         plt.show()
 
         return
 
-    def calibrate(self, mode='gamma', tiles=4):
-        """Get coordinate from index by interpolating grid-points
+    def calibrate(self, mode='gamma', tiles=4, workers=None, dtype=None, out=None, inplace=False, db=False,
+                  noise=False):
+        """Calibrate the image by interpolating the calibration grid-points.
+        The result is equal to earlier versions within float64 rounding, not bit-identical. See tools.calibration
 
         Args:
-            mode(string): 'sigma_0', 'beta' or 'gamma'
+            mode(string): 'sigma_0', 'beta_0' or 'gamma'
             tiles(int): number of tiles the image is divided into. This saves memory but reduce speed a bit
+            workers(int or concurrent.futures.Executor): Calibrate the bands in parallel threads.
+                            If None the bands are calibrated one at the time
+            dtype(data type): data type of the calibrated bands. np.float32 halves the memory.
+                            If None float64, or float32 if db is True
+            out(list of 2d numpy arrays): Preallocated float array (e.g. numpy.memmap) for each band
+            inplace(bool): Write the result into the bands of this image. The bands must be writable float arrays
+            db(bool): Return the calibrated image in decibel. The same as calibrate().to_db() but the conversion
+                            is done in the same pass as the calibration without a float64 intermediate image
+            noise(bool): Remove the thermal noise in the same pass as the calibration. The same as
+                            remove_thermal_noise().calibrate() without the intermediate image
 
         Returns:
             Calibrated image as (SarImage)
 
         Raises:
+            ValueError: out does not match the bands, the bands can not be written in place or
+                            noise is True and the calibration tables have no noise tables
         """
         if 'raw' not in self.unit:
             warnings.warn('Raw is not in units. The image have all ready been calibrated')
-        
-        calibrated_bands = []
-        for i, band in enumerate(self.bands):
+        if noise and any('noise' not in table for table in self.calibration_tables):
+            raise ValueError('The calibration tables have no noise tables. The noise may have been removed')
+        out = self._output_bands(out, inplace)
+        if dtype is None:
+            dtype = np.float32 if db else np.float64
+
+        def calibrate_band(i):
             row = self.calibration_tables[i]['row']
             column = self.calibration_tables[i]['column']
             calibration_values = self.calibration_tables[i][mode]
-            calibrated_bands.append(tools.calibration(band, row, column, calibration_values, tiles=tiles))
+            noise_table = self.calibration_tables[i]['noise'] if noise else None
+            return tools.calibration(self.bands[i], row, column, calibration_values, tiles=tiles,
+                                     out=out[i], dtype=dtype, db=db, noise=noise_table)
+
+        calibrated_bands = tools.parallel_map(calibrate_band, range(len(self.bands)), workers)
 
         return SarImage(calibrated_bands, mission=self.mission, time=self.time,
                         footprint=self.footprint, product_meta=self.product_meta,
                         band_names=self.band_names, calibration_tables=self.calibration_tables,
                         geo_tie_point=self.geo_tie_point, band_meta=self.band_meta,
-                        unit=mode)
+                        unit=mode + ' dB' if db else mode)
+
+    def remove_thermal_noise(self, workers=None, dtype=np.float64, out=None, inplace=False, block_rows=1024):
+        """Remove the thermal noise with the noise vectors of the product as sqrt(max(amplitude**2 - noise, 0)).
+            The range noise grid is interpolated like the calibration grid and multiplied by the azimuth noise
+            of each block. The noise tables are removed from the calibration tables of the result,
+            so the noise can not be removed twice. Use calibrate(noise=True) to remove the noise and calibrate
+            in one pass
+
+            Args:
+                workers(int or concurrent.futures.Executor): Process the bands in parallel threads.
+                            If None the bands are processed one at the time
+                dtype(data type): data type of the result
+                out(list of 2d numpy arrays): Preallocated float array (e.g. numpy.memmap) for each band
+                inplace(bool): Write the result into the bands of this image. The bands must be writable float arrays
+                block_rows(int): number of rows read at the time. Bands that are LazyBand or numpy.memmap
+                            are only read one block at the time
+
+            Returns:
+                Image without thermal noise (SarImage) with unit 'raw amplitude'
+
+            Raises:
+                ValueError: The image is not a raw amplitude, the calibration tables have no noise tables,
+                            out does not match the bands or the bands can not be written in place
+        """
+        if 'raw' not in self.unit or 'amplitude' not in self.unit:
+            raise ValueError('Thermal noise can only be removed from raw amplitudes')
+        if any('noise' not in table for table in self.calibration_tables):
+            raise ValueError('The calibration tables have no noise tables. The noise may have been removed')
+        out = self._output_bands(out, inplace)
+
+        def remove_noise_band(i):
+            return tools.remove_thermal_noise(self.bands[i], self.calibration_tables[i]['noise'], out=out[i],
+                                              dtype=dtype, block_rows=block_rows)
+
+        bands = tools.parallel_map(remove_noise_band, range(len(self.bands)), workers)
+        calibration_tables = [{key: value for key, value in table.items() if key != 'noise'}
+                              for table in self.calibration_tables]
+
+        return SarImage(bands, mission=self.mission, time=self.time,
+                        footprint=self.footprint, product_meta=self.product_meta,
+                        band_names=self.band_names, calibration_tables=calibration_tables,
+                        geo_tie_point=self.geo_tie_point, band_meta=self.band_meta,
+                        unit=self.unit)
+
+    def to_db(self, workers=None, dtype=None, out=None, inplace=False):
+        """Convert  to decibel. 10 * log10 for intensities and 20 * log10 for amplitudes.
+            Complex (SLC) bands are converted from the amplitude. Earlier versions used the natural logarithm
+
+            Args:
+                workers(int or concurrent.futures.Executor): Convert the bands in parallel threads.
+                            If None the bands are converted one at the time
+                dtype(data type): data type of the result. If None the numpy default for log of the bands
+                out(list of 2d numpy arrays): Preallocated float array (e.g. numpy.memmap) for each band
+                inplace(bool): Write the result into the bands of this image. The bands must be writable
+                            float arrays
+
+            Returns:
+                Image in decibel (SarImage)
 
-    def to_db(self):
-        """Convert  to decibel
+            Raises:
+                ValueError: out does not match the bands or the bands can not be written in place
                 """
-        db_bands = []
-        for band in self.bands:
-            if 'amplitude' in self.unit:
-                db_bands.append(20*np.log(band))
-            else:
-                db_bands.append(10 * np.log(band))
+        out = self._output_bands(out, inplace)
+        factor = 20 if 'amplitude' in self.unit or 'complex' in self.unit else 10
+
+        def to_db_band(i):
+            return tools.to_db(self.bands[i], factor, out=out[i], dtype=dtype)
+
+        db_bands = tools.parallel_map(to_db_band, range(len(self.bands)), workers)
 
         return SarImage(db_bands, mission=self.mission, time=self.time,
                         footprint=self.footprint, product_meta=self.product_meta,
                         band_names=self.band_names, calibration_tables=self.calibration_tables,
                         geo_tie_point=self.geo_tie_point, band_meta=self.band_meta,
-                        unit=(self.unit+' dB'))
+                        unit=(self.unit.replace('complex', 'amplitude') + ' dB'))
 
-    def boxcar(self, kernel_size, **kwargs):
+    def boxcar(self, kernel_size, workers=None, dtype=np.float64, out=None, inplace=False, **kwargs):
         """Simple (kernel_size x kernel_size) boxcar filter.
             Args:
                 kernel_size(int): size of kernel
-                **kwargs: Additional arguments passed to scipy.ndimage.convolve
+                workers(int or concurrent.futures.Executor): Filter the bands in parallel threads.
+                            If None the bands are filtered one at the time
+                dtype(data type): data type of the result
+                out(list of 2d numpy arrays): Preallocated array (e.g. numpy.memmap) for each band
+                inplace(bool): Write the result into the bands of this image. The bands must be writable
+                            float arrays
+                **kwargs: Additional arguments passed to tools.boxcar (method, mode, cval, origin)
 
             Returns:
                 Filtered image
+
+            Raises:
+                ValueError: out does not match the bands or inplace with bands that can not be written
         """
+        out = self._output_bands(out, inplace)
+
+        def boxcar_band(i):
+            output = dtype if out[i] is None else out[i]
+            return tools.boxcar(self.bands[i], kernel_size, output=output, **kwargs)
 
-        filter_bands = []
-        for band in self.bands:
-            filter_bands.append(tools.boxcar(band, kernel_size, **kwargs))
+        filter_bands = tools.parallel_map(boxcar_band, range(len(self.bands)), workers)
 
         return SarImage(filter_bands, mission=self.mission, time=self.time,
                         footprint=self.footprint, product_meta=self.product_meta,
@@ -267,13 +496,257 @@ class SarImage:
                         geo_tie_point=self.geo_tie_point, band_meta=self.band_meta,
                         unit=self.unit)
 
-    def save(self, path):
+    def _output_bands(self, out, inplace):
+        """Check the output arrays of an operation. Returns a list with an array or None for each band"""
+        if inplace:
+            for band in self.bands:
+                if not (isinstance(band, np.ndarray) and band.flags.writeable
+                        and np.issubdtype(band.dtype, np.floating)):
+                    raise ValueError('inplace requires the bands to be writable float numpy arrays')
+            return list(self.bands)
+        if out is None:
+            return [None] * len(self.bands)
+        if len(out) != len(self.bands) or any(elem.shape != band.shape for elem, band in zip(out, self.bands)):
+            raise ValueError('out must contain an array with the shape of the band for each band')
+        return list(out)
+
+    def multilook(self, az_looks, rg_looks, edge='drop', workers=None, dtype=np.float64, block_rows=1024):
+        """Multilook the image by averaging the intensities in blocks of (az_looks x rg_looks) pixels.
+            Unlike slicing with a step this reduces the speckle. Amplitudes are averaged as intensities.
+            Complex (SLC) bands are averaged as intensities |z|**2 and the result is the amplitude.
+            See tools.multilook
+
+            Args:
+                az_looks(int): number of rows (azimuth) in a block
+                rg_looks(int): number of columns (range) in a block
+                edge(str): 'drop' to drop the rows and columns at the end that do not fill a block,
+                            or 'partial' to average the pixels that are there
+                workers(int or concurrent.futures.Executor): Multilook the bands in parallel threads.
+                            If None the bands are processed one at the time
+                dtype(data type): data type of the result
+                block_rows(int): approximate number of rows read at the time. Bands that are LazyBand
+                            or numpy.memmap are only read one strip at the time
+
+            Returns:
+                Multilooked image (SarImage)
+        """
+        if 'dB' in self.unit:
+            warnings.warn('Multilooking averages intensities. The image is in dB')
+        # Complex (SLC) bands are averaged as intensities and the result is the amplitude
+        amplitude = 'amplitude' in self.unit or 'complex' in self.unit
+
+        multilooked_bands = tools.parallel_map(lambda band: tools.multilook(band, az_looks, rg_looks,
+                                                                            amplitude=amplitude, edge=edge,
+                                                                            block_rows=block_rows, dtype=dtype),
+                                               self.bands, workers)
+
+        # Pixel i of the result is centered at pixel (i + 0.5) * looks - 0.5 of the image
+        row_start, column_start = (az_looks - 1) / 2, (rg_looks - 1) / 2
+        geo_tie_point, calibration_tables = self._transformed_tables(row_start, az_looks, column_start, rg_looks)
+
+        footprint = self.footprint
+        if edge == 'drop':
+            # Adjust footprint to the rows and columns that are not dropped. Corners as in __getitem__
+            row_stop = multilooked_bands[0].shape[0] * az_looks
+            column_stop = multilooked_bands[0].shape[1] * rg_looks
+            footprint_lat, footprint_long = self.get_coordinate(np.array([0, 0, row_stop, row_stop]),
+                                                                np.array([0, column_stop, 0, column_stop]))
+            footprint = {'latitude': footprint_lat, 'longitude': footprint_long}
+
+        image = SarImage(multilooked_bands, mission=self.mission, time=self.time,
+                         footprint=footprint, product_meta=self.product_meta,
+                         band_names=self.band_names, calibration_tables=calibration_tables,
+                         geo_tie_point=geo_tie_point, band_meta=self.band_meta,
+                         unit=self.unit.replace('complex', 'amplitude'))
+        self._share_geolocation(image, row_start, az_looks, column_start, rg_looks)
+        return image
+
+    def iter_tiles(self, size, overlap=0, stride=None, batch_size=16, calibrate=None, db=False, edge='shift',
+                   prefetch=0):
+        """Generator of batches of (size x size) tiles for e.g. inference with a CNN. See tiles.iter_tiles
+            The image is read one strip of tiles at the time, so with lazy bands (s1_load(path, lazy=True))
+            the scene is never in memory.
+
+            Example:
+                for batch, windows, latitude, longitude in img.iter_tiles(256, overlap=32, calibrate='sigma_0',
+                                                                         db=True, prefetch=2):
+                    prediction = model(batch)
+
+            Args:
+                size(int): size of the tiles
+                overlap(int): number of pixels adjacent tiles overlap. Ignored if stride is given
+                stride(int): distance between the starts of the tiles. If None size - overlap
+                batch_size(int): number of tiles in a batch
+                calibrate(str): 'sigma_0', 'beta_0' or 'gamma'. If None the values of the bands are used
+                db(bool): Convert to decibel
+                edge(str): 'shift' to add tiles ending at the edge, 'pad' to pad tiles at the edge with 0
+                            or 'drop' to leave out the edge
+                prefetch(int): Number of batches prepared ahead in a background thread. 0 for no thread
+
+            Returns:
+                generator of (batch, windows, latitude, longitude). batch is a contiguous float32 array with
+                shape (tiles, bands, size, size), windows the ((row_start, row_stop), (column_start, column_stop))
+                of each tile and latitude and longitude of the corners of each tile with shape (tiles, 4)
+        """
+        return tiles.iter_tiles(self, size, overlap=overlap, stride=stride, batch_size=batch_size,
+                                calibrate=calibrate, db=db, edge=edge, prefetch=prefetch)
+
+    def deburst(self, swath=None, out=None, workers=None):
+        """Merge the bursts of a sub swath of a SLC image (see s1_load) to one band for each polarisation.
+            The bursts are read and written one at the time, so with LazyBand bursts and a numpy.memmap as out
+            the sub swath is never in memory. Where bursts overlap the middle of the overlap is used as
+            boundary. The bands can also be calibrated bursts (calibrate keeps the band meta data).
+            See slc.burst_layout
+
+            Args:
+                swath(str): The sub swath, e.g. 'IW2'. If None the image must contain only one sub swath
+                out(list of 2d numpy arrays): Preallocated array (e.g. numpy.memmap) for each polarisation
+                workers(int or concurrent.futures.Executor): Deburst the polarisations in parallel threads.
+                            If None the polarisations are processed one at the time
+
+            Returns:
+                Debursted image (SarImage) with the polarisations as band names. The noise tables are not kept
+
+            Raises:
+                ValueError: The image has no bursts, swath is not given for several sub swaths or out has the
+                            wrong number of bands or shape
+        """
+        bursts = [i for i in range(len(self.bands)) if 'burst' in (self.band_meta[i] or {})]
+        if len(bursts) == 0:
+            raise ValueError('The image has no bursts. Load a SLC product with s1_load')
+        swaths = sorted(set(self.band_meta[i]['swath'] for i in bursts))
+        if swath is None:
+            if len(swaths) != 1:
+                raise ValueError('The image has the sub swaths %s. Give swath' % str(swaths))
+            swath = swaths[0]
+        swath = swath.upper()
+
+        # Bursts of each polarisation sorted by burst
+        polarisation = []
+        for i in bursts:
+            if self.band_meta[i]['swath'] == swath and self.band_meta[i]['polarisation'] not in polarisation:
+                polarisation.append(self.band_meta[i]['polarisation'])
+        groups = [sorted([i for i in bursts if self.band_meta[i]['swath'] == swath
+                          and self.band_meta[i]['polarisation'] == pol], key=lambda i: self.band_meta[i]['burst'])
+                  for pol in polarisation]
+        if len(groups) == 0:
+            raise ValueError('The image has no bursts of swath %s' % swath)
+        if out is None:
+            out = [None] * len(groups)
+        elif len(out) != len(groups):
+            raise ValueError('out must contain an array for each polarisation')
+
+        def deburst_polarisation(j):
+            group = groups[j]
+            band_meta = [self.band_meta[i] for i in group]
+            layout, n_rows = slc.burst_layout(band_meta)
+            band = slc.deburst_band([self.bands[i] for i in group], band_meta, layout, n_rows, out=out[j])
+            lines_per_burst = self.bands[group[0]].shape[0]
+            geo_tie_point = slc.merge_geo_tie_point([self.geo_tie_point[i] for i in group], layout, lines_per_burst)
+            calibration_table = slc.merge_calibration_tables([self.calibration_tables[i] for i in group], layout,
+                                                             lines_per_burst)
+            meta = {key: value for key, value in band_meta[0].items()
+                    if key not in ('burst', 'burst_azimuth_time', 'first_valid_line', 'last_valid_line',
+                                   'first_valid_sample', 'last_valid_sample')}
+            return band, geo_tie_point, calibration_table, meta
+
+        results = tools.parallel_map(deburst_polarisation, range(len(groups)), workers)
+
+        image = SarImage([elem[0] for elem in results], mission=self.mission, time=self.time,
+                         footprint=self.footprint, product_meta=self.product_meta,
+                         band_names=polarisation, calibration_tables=[elem[2] for elem in results],
+                         geo_tie_point=[elem[1] for elem in results], band_meta=[elem[3] for elem in results],
+                         unit=self.unit)
+        # Footprint of the sub swath
+        n_rows, n_columns = image.bands[0].shape
+        footprint_lat, footprint_long = image.get_coordinate(np.array([0, 0, n_rows - 1, n_rows - 1]),
+                                                             np.array([0, n_columns - 1, 0, n_columns - 1]))
+        image.footprint = {'latitude': footprint_lat, 'longitude': footprint_long}
+        return image
+
+    def lee(self, size, looks=1, tiles=1, workers=None, **kwargs):
+        """Lee speckle filter. See speckle.lee
+            Args:
+                size(int): size of the window
+                looks(number): equivalent number of looks of the image
+                tiles(int): number of tiles each band is divided into. This saves memory
+                workers(int or concurrent.futures.Executor): Filter the bands in parallel threads
+                **kwargs: Additional arguments passed to speckle.lee (mode, cval)
+
+            Returns:
+                Filtered image
+        """
+        return self._speckle_filter(speckle.lee, workers, size=size, looks=looks, tiles=tiles, **kwargs)
+
+    def enhanced_lee(self, size, looks=1, damping=1.0, tiles=1, workers=None, **kwargs):
+        """Enhanced Lee speckle filter. See speckle.enhanced_lee
+            Args:
+                size(int): size of the window
+                looks(number): equivalent number of looks of the image
+                damping(number): damping factor. Larger values preserve edges better
+                tiles(int): number of tiles each band is divided into. This saves memory
+                workers(int or concurrent.futures.Executor): Filter the bands in parallel threads
+                **kwargs: Additional arguments passed to speckle.enhanced_lee (mode, cval)
+
+            Returns:
+                Filtered image
+        """
+        return self._speckle_filter(speckle.enhanced_lee, workers, size=size, looks=looks, damping=damping,
+                                    tiles=tiles, **kwargs)
+
+    def frost(self, size, damping=2.0, tiles=1, workers=None, **kwargs):
+        """Frost speckle filter. See speckle.frost
+            Args:
+                size(int): size of the window
+                damping(number): damping factor. Larger values preserve edges better
+                tiles(int): number of tiles each band is divided into. This saves memory
+                workers(int or concurrent.futures.Executor): Filter the bands in parallel threads
+                **kwargs: Additional arguments passed to speckle.frost (mode, cval)
+
+            Returns:
+                Filtered image
+        """
+        return self._speckle_filter(speckle.frost, workers, size=size, damping=damping, tiles=tiles, **kwargs)
+
+    def gamma_map(self, size, looks=1, tiles=1, workers=None, **kwargs):
+        """Gamma-MAP speckle filter. See speckle.gamma_map
+            Args:
+                size(int): size of the window
+                looks(number): equivalent number of looks of the image
+                tiles(int): number of tiles each band is divided into. This saves memory
+                workers(int or concurrent.futures.Executor): Filter the bands in parallel threads
+                **kwargs: Additional arguments passed to speckle.gamma_map (mode, cval)
+
+            Returns:
+                Filtered image
+        """
+        return self._speckle_filter(speckle.gamma_map, workers, size=size, looks=looks, tiles=tiles, **kwargs)
+
+    def _speckle_filter(self, function, workers, **kwargs):
+        """Apply a filter from speckle to all bands and return the filtered SarImage"""
+        if 'dB' in self.unit:
+            warnings.warn('The speckle filters expect intensities. The image is in dB')
+
+        filter_bands = tools.parallel_map(lambda band: function(band, **kwargs), self.bands, workers)
+
+        return SarImage(filter_bands, mission=self.mission, time=self.time,
+                        footprint=self.footprint, product_meta=self.product_meta,
+                        band_names=self.band_names, calibration_tables=self.calibration_tables,
+                        geo_tie_point=self.geo_tie_point, band_meta=self.band_meta,
+                        unit=self.unit)
+
+    def save(self, path, file_format='npy'):
         """Save the SarImage object in a folder at path.
+            With file_format='npy' each band is saved as a .npy file that can be memory mapped, the
+            geo_tie_point and calibration_tables as a .npz file and the rest of the meta data as json.
+            file_format='pickle' saves all elements as pickle files as in earlier versions of sarpy.
+
             Args:
                 path(str): Path of the folder where the the SarImage is saved.
                         Note that the folder is created and must not exist in advance
+                file_format(str): 'npy' or 'pickle'
             Raises:
-                ValueError: There already exist a folder at path
+                ValueError: There already exist a folder at path or unknown file_format
         """
 
         # Check if folder exists
@@ -281,9 +754,24 @@ class SarImage:
             print('please give a path that is not used')
             raise ValueError
 
+        if file_format not in ('npy', 'pickle'):
+            raise ValueError('file_format must be "npy" or "pickle"')
+
         # make folder
         os.makedirs(path)
 
+        reduced_calibration = self._reduced_calibration_tables()
+
+        if file_format == 'npy':
+            storage.write_bands(path, self.bands)
+            storage.write_tables(os.path.join(path, storage.TABLES_FILE), geo_tie_point=self.geo_tie_point,
+                                 calibration_tables=reduced_calibration)
+            meta = {'format_version': storage.FORMAT_VERSION, 'n_bands': len(self.bands), 'mission': self.mission,
+                    'time': self.time, 'unit': self.unit, 'footprint': self.footprint,
+                    'band_names': self.band_names, 'band_meta': self.band_meta, 'product_meta': self.product_meta}
+            storage.write_meta(os.path.join(path, storage.META_FILE), meta)
+            return
+
         # save elements in separate files
 
         # product_meta
@@ -312,8 +800,81 @@ class SarImage:
 
         # bands
         file_path = os.path.join(path, 'bands.pkl')
-        pickle.dump(self.bands, open(file_path, "wb"))
+        pickle.dump([np.asarray(band) for band in self.bands], open(file_path, "wb"))
+
+        # calibration_tables
+        file_path = os.path.join(path, 'calibration_tables.pkl')
+        pickle.dump(reduced_calibration, open(file_path, "wb"))
+
+        return
+
+    def to_geotiff(self, path, dtype='float32', compress='deflate', block_size=512, overviews=None,
+                   resampling='average'):
+        """Save the bands as a cloud optimized GeoTIFF (tiled, compressed and with internal overviews).
+            The geo tie points are written as GCPs and the band names and unit as tags.
+            Complex (SLC) bands are written as amplitudes unless dtype is complex.
 
+            Args:
+                path(str): Path of the GeoTIFF
+                dtype(str): Data type of the GeoTIFF. e.g. 'float32' or 'complex64'
+                compress(str): Compression passed to GDAL. e.g. 'deflate', 'lzw', 'zstd' or None
+                block_size(int): Size of the tiles
+                overviews(list of int): Decimation factors of the overviews. If None factors of 2, 4, 8, ...
+                                        are used until the overview is smaller than a tile
+                resampling(str): Resampling used for the overviews. e.g. 'average', 'nearest' or 'rms'
+        """
+        height, width = self.bands[0].shape
+        if overviews is None:
+            overviews = []
+            factor = 2
+            while max(height, width) / factor >= block_size:
+                overviews.append(factor)
+                factor *= 2
+
+        # Tie points from the first band
+        gcps = _ground_control_points(self.geo_tie_point[0])
+
+        # Complex bands are written as amplitudes to a real GeoTIFF
+        amplitude = (not np.issubdtype(dtype, np.complexfloating)
+                     and any(np.issubdtype(band.dtype, np.complexfloating) for band in self.bands))
+        unit = self.unit.replace('complex', 'amplitude') if amplitude else self.unit
+
+        profile = {'driver': 'GTiff', 'height': height, 'width': width, 'count': len(self.bands), 'dtype': dtype,
+                   'tiled': True, 'blockxsize': block_size, 'blockysize': block_size, 'BIGTIFF': 'IF_SAFER',
+                   'gcps': gcps, 'crs': CRS.from_epsg(4326)}
+        if compress is not None:
+            profile['compress'] = compress
+
+        # The overviews must be placed before the full resolution image in a COG. Therefore the image is first
+        # written to a temporary file and copied.
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as tmp_dir:
+            tmp_path = os.path.join(tmp_dir, 'tmp.tif')
+            with rasterio.open(tmp_path, 'w', **profile) as dst:
+                for i, band in enumerate(self.bands):
+                    # Write one row of tiles at the time
+                    for row_start in range(0, height, block_size):
+                        row_end = min(row_start + block_size, height)
+                        block = np.asarray(band[row_start:row_end, :])
+                        if np.iscomplexobj(block) and amplitude:
+                            block = np.abs(block)
+                        block = block.astype(dtype, copy=False)
+                        dst.write(block, i + 1, window=((row_start, row_end), (0, width)))
+                    if self.band_names is not None:
+                        dst.set_band_description(i + 1, self.band_names[i])
+                        dst.update_tags(i + 1, name=self.band_names[i], unit=unit)
+                dst.update_tags(mission=self.mission, time=str(self.time), unit=unit,
+                                band_names=','.join(self.band_names or []))
+                if overviews:
+                    dst.build_overviews(overviews, Resampling[resampling])
+                    dst.update_tags(ns='rio_overview', resampling=resampling)
+
+            copy_options = {key: profile[key] for key in ('tiled', 'blockxsize', 'blockysize', 'BIGTIFF', 'compress')
+                            if key in profile}
+            rasterio.shutil.copy(tmp_path, path, driver='GTiff', copy_src_overviews=True, **copy_options)
+        return
+
+    def _reduced_calibration_tables(self):
+        """Calibration tables with only the rows and columns needed to calibrate the image"""
         # reduce size of calibration_tables list
         reduced_calibration = []
         for i in range(len(self.bands)):
@@ -342,14 +903,12 @@ class SarImage:
                 "gamma": cal["gamma"][index_row, :][:, index_column],
                 "dn": cal["dn"][index_row, :][:, index_column]
             }
+            if 'noise' in cal:
+                reduced_cal_i['noise'] = cal['noise']
 
             reduced_calibration.append(reduced_cal_i)
 
-        # calibration_tables
-        file_path = os.path.join(path, 'calibration_tables.pkl')
-        pickle.dump(reduced_calibration, open(file_path, "wb"))
-
-        return
+        return reduced_calibration
 
     def pop(self, index=-1):
         """
@@ -0,0 +1,130 @@
+import numpy as np
+
+
+def burst_layout(band_meta):
+    """Position of the bursts of a sub swath in the debursted image.
+
+    The bursts overlap in azimuth. The line of a burst in the debursted image is found from the azimuth time
+    of its first line. Where two bursts overlap the valid lines of the first burst are used until the middle
+    of the overlap and the valid lines of the next burst after. The first row of the debursted image is the
+    first valid line of the first burst.
+
+    Args:
+        band_meta(list of dict): band_meta of the bursts sorted by burst (see s1_load). Uses burst_azimuth_time,
+                    azimuth_time_interval, first_valid_line and last_valid_line
+
+    Returns:
+        layout(list of tuple): (offset, row_start, row_stop) of each burst. Line l of the burst is row offset + l
+                    of the debursted image and the rows row_start to row_stop (exclusive) are from the burst
+        n_rows(int): number of rows of the debursted image
+    """
+    interval = band_meta[0]['azimuth_time_interval']
+    offsets = [int(round((meta['burst_azimuth_time'] - band_meta[0]['burst_azimuth_time']).total_seconds()
+                         / interval)) for meta in band_meta]
+    starts = [offset + meta['first_valid_line'] for offset, meta in zip(offsets, band_meta)]
+    stops = [offset + meta['last_valid_line'] + 1 for offset, meta in zip(offsets, band_meta)]
+
+    # Cut in the middle of the overlap of consecutive bursts
+    cuts = [(stop + start) // 2 if stop > start else stop for stop, start in zip(stops[:-1], starts[1:])]
+    row_starts = [starts[0]] + [max(cut, start) for cut, start in zip(cuts, starts[1:])]
+    row_stops = [min(cut, stop) for cut, stop in zip(cuts, stops[:-1])] + [stops[-1]]
+
+    first_row = starts[0]
+    layout = [(offset - first_row, row_start - first_row, row_stop - first_row)
+              for offset, row_start, row_stop in zip(offsets, row_starts, row_stops)]
+    return layout, stops[-1] - first_row
+
+
+def deburst_band(bands, band_meta, layout, n_rows, out=None):
+    """Merge the bursts of a sub swath to one band. The bursts are read and written one at the time,
+    so only one burst is in memory. Samples outside the valid samples of a burst are 0.
+
+    Args:
+        bands(list of 2d array like): the bursts, e.g. LazyBand from s1_load, sorted by burst
+        band_meta(list of dict): band_meta of the bursts. Uses first_valid_sample and last_valid_sample
+        layout(list of tuple): see burst_layout
+        n_rows(int): number of rows of the debursted image. See burst_layout
+        out(2d numpy array): Preallocated array (e.g. numpy.memmap) with shape (n_rows, columns of the bursts)
+
+    Returns:
+        debursted band (2d numpy array)
+
+    Raises:
+        ValueError: out has the wrong shape
+    """
+    shape = (n_rows, bands[0].shape[1])
+    if out is None:
+        out = np.zeros(shape, dtype=bands[0].dtype)
+    elif out.shape != shape:
+        raise ValueError('out must have shape %s' % str(shape))
+
+    row = 0
+    for band, meta, (offset, row_start, row_stop) in zip(bands, band_meta, layout):
+        # Rows without a valid burst (a gap between bursts)
+        out[row:row_start, :] = 0
+        if row_stop > row_start:
+            block = np.asarray(band[row_start - offset:row_stop - offset, :])
+            out[row_start:row_stop, :meta['first_valid_sample']] = 0
+            out[row_start:row_stop, meta['first_valid_sample']:meta['last_valid_sample'] + 1] = \
+                block[:, meta['first_valid_sample']:meta['last_valid_sample'] + 1]
+            out[row_start:row_stop, meta['last_valid_sample'] + 1:] = 0
+        row = max(row, row_stop)
+    return out
+
+
+def _burst_points(tables, layout, lines_per_burst):
+    """Mask of the rows of each table in its burst and the rows moved to the debursted image"""
+    inside = [(table['row'] >= 0) & (table['row'] < lines_per_burst) for table in tables]
+    rows = [table['row'][mask] + offset for table, mask, (offset, _, _) in zip(tables, inside, layout)]
+    return inside, rows
+
+
+def merge_geo_tie_point(geo_tie_point, layout, lines_per_burst):
+    """Merge the geo tie points of the bursts of a sub swath to the debursted image.
+    The tie points in each burst are moved to the debursted image. The tie points in the overlap of two bursts
+    are kept from both bursts (they are on the same ground).
+
+    Args:
+        geo_tie_point(list of dict): geo tie points of the bursts sorted by burst. The rows are relative to the burst
+        layout(list of tuple): see burst_layout
+        lines_per_burst(int): number of lines in a burst
+
+    Returns:
+        geo_tie_point (dict)
+    """
+    inside, rows = _burst_points(geo_tie_point, layout, lines_per_burst)
+    merged = {key: np.concatenate([geo[key][mask] for geo, mask in zip(geo_tie_point, inside)])
+              for key in geo_tie_point[0]}
+    merged['row'] = np.concatenate(rows)
+    return merged
+
+
+def merge_calibration_tables(calibration_tables, layout, lines_per_burst):
+    """Merge the calibration tables of the bursts of a sub swath to the debursted image.
+    The calibration vectors in each burst are moved to the debursted image and sorted by row. Of vectors
+    on the same row only the first is kept. The noise tables are not merged. Remove the noise from the bursts
+    before they are debursted (calibrate(noise=True)).
+
+    Args:
+        calibration_tables(list of dict): calibration tables of the bursts sorted by burst. The rows are relative
+                    to the burst
+        layout(list of tuple): see burst_layout
+        lines_per_burst(int): number of lines in a burst
+
+    Returns:
+        calibration table (dict)
+    """
+    inside, rows = _burst_points(calibration_tables, layout, lines_per_burst)
+    rows, order = np.unique(np.concatenate(rows), return_index=True)
+
+    merged = {}
+    for key, value in calibration_tables[0].items():
+        if key == 'noise':
+            continue
+        if isinstance(value, np.ndarray) and value.ndim == 2:
+            # Values of each vector
+            merged[key] = np.concatenate([table[key][mask] for table, mask in zip(calibration_tables, inside)])[order]
+        else:
+            merged[key] = value
+    merged['row'] = rows
+    return merged
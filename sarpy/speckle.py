@@ -0,0 +1,201 @@
+import numpy as np
+from scipy import ndimage
+
+# np.pad modes matching the scipy.ndimage border modes
+_PAD_MODES = {'reflect': 'symmetric', 'mirror': 'reflect', 'nearest': 'edge', 'wrap': 'wrap', 'constant': 'constant'}
+
+
+def local_statistics(img, size, mode='reflect', cval=0.0):
+    """Local mean and variance in a (size x size) window.
+    Both are found with running sums (scipy.ndimage.uniform_filter), so the cost does not depend on size.
+
+    Args:
+        img(2d numpy array): image
+        size(int): size of the window
+        mode(str): border mode as in scipy.ndimage. 'reflect', 'constant', 'nearest', 'mirror' or 'wrap'
+        cval(number): value outside the image if mode is 'constant'
+
+    Returns:
+        mean(2d numpy array): local mean
+        variance(2d numpy array): local variance
+    """
+    img = np.asarray(img, dtype=float)
+    mean = ndimage.uniform_filter(img, size, mode=mode, cval=cval)
+    mean_square = ndimage.uniform_filter(img ** 2, size, mode=mode, cval=cval ** 2)
+    variance = np.maximum(mean_square - mean ** 2, 0)
+    return mean, variance
+
+
+def _variation(mean, variance):
+    # Local coefficient of variation. 0 where the mean is 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(mean > 0, np.sqrt(variance) / mean, 0)
+
+
+def _tiled(function, img, halo, tiles, mode):
+    """Apply function to blocks of rows of img with halo extra rows on each side.
+    The halo rows are removed from the result, so it is the same as applying the function to the entire image
+    as long as each output pixel only depends on pixels less than halo rows away.
+    Only one block of img is read (e.g. from a LazyBand or numpy.memmap) and converted at the time.
+
+    Args:
+        function(callable): filter of a 2d float array
+        img(2d array like): image
+        halo(int): extra rows on each side of a block
+        tiles(int): number of blocks
+        mode(str): border mode of the filter
+
+    Returns:
+        filtered image (2d numpy array)
+
+    Raises:
+        ValueError: mode is 'wrap' and tiles > 1
+    """
+    if tiles == 1:
+        return function(np.asarray(img, dtype=float))
+    if mode == 'wrap':
+        raise ValueError('mode "wrap" can not be used with tiles > 1')
+
+    n_rows = img.shape[0]
+    result = np.empty(img.shape)
+    block_rows = max(int(np.ceil(n_rows / tiles)), 1)
+    for row_start in range(0, n_rows, block_rows):
+        row_end = min(row_start + block_rows, n_rows)
+        read_start = max(row_start - halo, 0)
+        read_end = min(row_end + halo, n_rows)
+        block = function(np.asarray(img[read_start:read_end, :], dtype=float))
+        result[row_start:row_end, :] = block[row_start - read_start:row_end - read_start, :]
+    return result
+
+
+def lee(img, size, looks=1, tiles=1, mode='reflect', cval=0.0):
+    """Lee filter for multiplicative speckle noise.
+    See Lee, J.S. (1980). Digital image enhancement and noise filtering by use of local statistics.
+
+    Args:
+        img(2d numpy array): image in intensity (not dB)
+        size(int): size of the window
+        looks(number): equivalent number of looks of the image
+        tiles(int): number of tiles the image is divided into. This saves memory
+        mode(str): border mode as in scipy.ndimage
+        cval(number): value outside the image if mode is 'constant'
+
+    Returns:
+        Filtered image
+    """
+    noise_variation = 1 / looks
+
+    def filter_block(block):
+        mean, variance = local_statistics(block, size, mode=mode, cval=cval)
+        # Variance of the signal without speckle
+        signal_variance = (variance - mean ** 2 * noise_variation) / (1 + noise_variation)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.clip(np.where(variance > 0, signal_variance / variance, 0), 0, 1)
+        return mean + weight * (block - mean)
+
+    return _tiled(filter_block, img, size // 2, tiles, mode)
+
+
+def enhanced_lee(img, size, looks=1, damping=1.0, tiles=1, mode='reflect', cval=0.0):
+    """Enhanced Lee filter. Homogeneous areas are averaged, point targets are kept and
+    the rest is weighted with an exponential in the coefficient of variation.
+    See Lopes, A., Touzi, R. and Nezry, E. (1990). Adaptive speckle filters and scene heterogeneity.
+
+    Args:
+        img(2d numpy array): image in intensity (not dB)
+        size(int): size of the window
+        looks(number): equivalent number of looks of the image
+        damping(number): damping factor. Larger values preserve edges better
+        tiles(int): number of tiles the image is divided into. This saves memory
+        mode(str): border mode as in scipy.ndimage
+        cval(number): value outside the image if mode is 'constant'
+
+    Returns:
+        Filtered image
+    """
+    cu = 1 / np.sqrt(looks)
+    c_max = np.sqrt(1 + 2 / looks)
+
+    def filter_block(block):
+        mean, variance = local_statistics(block, size, mode=mode, cval=cval)
+        ci = _variation(mean, variance)
+        # Weight is 0 for ci >= c_max. Clip to avoid overflow
+        ci_clipped = np.minimum(ci, c_max)
+        with np.errstate(divide='ignore'):
+            weight = np.exp(-damping * (ci_clipped - cu) / (c_max - ci_clipped))
+        result = np.where(ci <= cu, mean, mean * weight + block * (1 - weight))
+        return np.where(ci >= c_max, block, result)
+
+    return _tiled(filter_block, img, size // 2, tiles, mode)
+
+
+def frost(img, size, damping=2.0, tiles=1, mode='reflect', cval=0.0):
+    """Frost filter. Weighted mean with weights exp(-damping * ci^2 * distance) where ci is the
+    local coefficient of variation and distance is the distance to the centre of the window.
+    See Frost, V.S. et al. (1982). A model for radar images and its application to adaptive digital
+    filtering of multiplicative noise.
+
+    Args:
+        img(2d numpy array): image in intensity (not dB)
+        size(int): size of the window
+        damping(number): damping factor. Larger values preserve edges better
+        tiles(int): number of tiles the image is divided into. This saves memory
+        mode(str): border mode as in scipy.ndimage
+        cval(number): value outside the image if mode is 'constant'
+
+    Returns:
+        Filtered image
+    """
+    radius = size // 2
+
+    def filter_block(block):
+        mean, variance = local_statistics(block, size, mode=mode, cval=cval)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ci2 = np.where(mean > 0, variance / mean ** 2, 0)
+        pad_kwargs = {'constant_values': cval} if mode == 'constant' else {}
+        padded = np.pad(block, radius, mode=_PAD_MODES[mode], **pad_kwargs)
+
+        # Sum over the window one offset at the time. Vectorised over the pixels
+        weighted_sum = np.zeros(block.shape)
+        weight_sum = np.zeros(block.shape)
+        n_rows, n_columns = block.shape
+        for i in range(-radius, size - radius):
+            for j in range(-radius, size - radius):
+                weight = np.exp(-damping * ci2 * np.sqrt(i ** 2 + j ** 2))
+                weighted_sum += weight * padded[radius + i:radius + i + n_rows, radius + j:radius + j + n_columns]
+                weight_sum += weight
+        return weighted_sum / weight_sum
+
+    return _tiled(filter_block, img, radius, tiles, mode)
+
+
+def gamma_map(img, size, looks=1, tiles=1, mode='reflect', cval=0.0):
+    """Gamma maximum a posteriori (Gamma-MAP) filter.
+    See Lopes, A., Touzi, R. and Nezry, E. (1990). Adaptive speckle filters and scene heterogeneity.
+
+    Args:
+        img(2d numpy array): image in intensity (not dB)
+        size(int): size of the window
+        looks(number): equivalent number of looks of the image
+        tiles(int): number of tiles the image is divided into. This saves memory
+        mode(str): border mode as in scipy.ndimage
+        cval(number): value outside the image if mode is 'constant'
+
+    Returns:
+        Filtered image
+    """
+    cu = 1 / np.sqrt(looks)
+    c_max = np.sqrt(2) * cu
+
+    def filter_block(block):
+        mean, variance = local_statistics(block, size, mode=mode, cval=cval)
+        ci = _variation(mean, variance)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = (1 + cu ** 2) / (ci ** 2 - cu ** 2)
+            b = alpha - looks - 1
+            d = mean ** 2 * b ** 2 + 4 * alpha * looks * mean * block
+            result = (b * mean + np.sqrt(np.maximum(d, 0))) / (2 * alpha)
+        result = np.where(ci <= cu, mean, result)
+        return np.where(ci >= c_max, block, result)
+
+    return _tiled(filter_block, img, size // 2, tiles, mode)
@@ -0,0 +1,152 @@
+import numpy as np
+import warnings
+from scipy import ndimage
+
+from .sarpy_class import SarImage
+
+
+class SarStack:
+    """ Class to contain a time series of co-registered SAR images of one band as a (time, row, column) array.
+    The array can be a numpy.memmap, so the stack does not have to fit in memory.
+
+    Attributes:
+        data(3d array): The measurements with shape (time, row, column). e.g. numpy array or numpy.memmap
+        time(list of datetime): start time of each acquisition
+        band_name(str): Name of the band. Normally the polarisation.
+        unit(str): unit of the measurements
+        footprint(dict): footprint of the first image
+        geo_tie_point(dict): geo tie points of the first image
+        calibration_tables(list of dict): calibration table of each image
+    """
+
+    def __init__(self, data, time=None, band_name=None, unit=None, footprint=None, geo_tie_point=None,
+                 calibration_tables=None):
+
+        # assign values
+        self.data = data
+        self.time = time
+        self.band_name = band_name
+        self.unit = unit
+        self.footprint = footprint
+        self.geo_tie_point = geo_tie_point
+        self.calibration_tables = calibration_tables
+
+    def __repr__(self):
+        return "SarStack: %d images of %s with shape %s" % (len(self), self.band_name, str(self.data.shape[1:]))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def get_image(self, index):
+        """Return SarImage of the image at index.
+
+            Args:
+                index(int): index in time
+
+            Returns:
+                SarImage with one band
+        """
+        time = None if self.time is None else self.time[index]
+        calibration_tables = None if self.calibration_tables is None else [self.calibration_tables[index]]
+        return SarImage([self.data[index]], time=time, footprint=self.footprint, band_names=[self.band_name],
+                        calibration_tables=calibration_tables, geo_tie_point=[self.geo_tie_point], unit=self.unit)
+
+    def quegan_filter(self, size, out=None, tile_size=512):
+        """Multi-temporal speckle filter. Each image is the local mean of the image times the mean over time
+        of the images divided by their local means:
+            J_k = E[I_k] / N * sum_i(I_i / E[I_i])
+        where E is the local mean in a (size x size) window.
+        See Quegan, S. and Yu, J.J. (2001). Filtering of multichannel SAR images.
+
+        The stack is processed one spatial tile at the time for all images, so only
+        (time x tile_size x tile_size) pixels are in memory.
+
+            Args:
+                size(int): size of the window of the local mean
+                out(3d array): Preallocated array (e.g. numpy.memmap) with the shape of data for the result.
+                                If None a float32 array is allocated
+                tile_size(int): size of the spatial tiles
+
+            Returns:
+                Filtered stack (SarStack)
+
+            Raises:
+                ValueError: out has the wrong shape
+        """
+        if self.unit is not None and 'dB' in self.unit:
+            warnings.warn('The filter expects intensities. The stack is in dB')
+
+        n_images, n_rows, n_columns = self.data.shape
+        if out is None:
+            out = np.empty(self.data.shape, dtype='float32')
+        elif out.shape != self.data.shape:
+            raise ValueError('out must have shape %s' % str(self.data.shape))
+
+        halo = size // 2
+        for row_start in range(0, n_rows, tile_size):
+            row_end = min(row_start + tile_size, n_rows)
+            read_row_start = max(row_start - halo, 0)
+            read_row_end = min(row_end + halo, n_rows)
+            for column_start in range(0, n_columns, tile_size):
+                column_end = min(column_start + tile_size, n_columns)
+                read_column_start = max(column_start - halo, 0)
+                read_column_end = min(column_end + halo, n_columns)
+
+                tile = np.asarray(self.data[:, read_row_start:read_row_end, read_column_start:read_column_end],
+                                  dtype=float)
+                # Local mean of each image
+                mean = ndimage.uniform_filter(tile, size=(1, size, size))
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    ratio = np.where(mean > 0, tile / mean, 0).sum(axis=0)
+                filtered = mean * ratio / n_images
+
+                out[:, row_start:row_end, column_start:column_end] = \
+                    filtered[:, row_start - read_row_start:row_end - read_row_start,
+                             column_start - read_column_start:column_end - read_column_start]
+
+        return SarStack(out, time=self.time, band_name=self.band_name, unit=self.unit,
+                        footprint=self.footprint, geo_tie_point=self.geo_tie_point,
+                        calibration_tables=self.calibration_tables)
+
+
+def create_stack(images, band_index=0, path=None, dtype='float32', block_rows=1024):
+    """Stack a band of co-registered SarImages into a SarStack.
+
+        Args:
+            images(list of SarImage): co-registered images with the same shape
+            band_index(int): index of the band to stack
+            path(str): If given the stack is written to a .npy file at path and memory mapped.
+                        Otherwise it is kept in memory
+            dtype(str): data type of the stack
+            block_rows(int): number of rows copied at the time. Bands that are LazyBand or numpy.memmap
+                        are only read one block at the time
+
+        Returns:
+            SarStack
+
+        Raises:
+            ValueError: The images do not have the same shape
+    """
+    shape = images[0].bands[band_index].shape
+    for image in images:
+        if image.bands[band_index].shape != shape:
+            raise ValueError('All images must have the same shape')
+
+    stack_shape = (len(images),) + tuple(shape)
+    if path is None:
+        data = np.empty(stack_shape, dtype=dtype)
+    else:
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=stack_shape)
+
+    for i, image in enumerate(images):
+        band = image.bands[band_index]
+        for row_start in range(0, shape[0], block_rows):
+            data[i, row_start:row_start + block_rows, :] = band[row_start:row_start + block_rows, :]
+
+    first = images[0]
+    calibration_tables = None
+    if all(image.calibration_tables is not None for image in images):
+        calibration_tables = [image.calibration_tables[band_index] for image in images]
+    return SarStack(data, time=[image.time for image in images], band_name=first.band_names[band_index],
+                    unit=first.unit, footprint=first.footprint, geo_tie_point=first.geo_tie_point[band_index],
+                    calibration_tables=calibration_tables)
@@ -0,0 +1,168 @@
+import numpy as np
+import datetime
+import json
+import os
+
+# Files in a folder saved with SarImage.save
+META_FILE = 'meta.json'
+TABLES_FILE = 'tables.npz'
+BAND_FILE = 'band_%d.npy'
+FORMAT_VERSION = 1
+
+
+def _encode(obj):
+    """Convert meta data to something json can write. numpy arrays and datetimes are tagged"""
+    if isinstance(obj, dict):
+        return {key: _encode(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(value) for value in obj]
+    if isinstance(obj, datetime.datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, np.ndarray):
+        return {'__ndarray__': obj.astype(str).tolist() if obj.dtype.kind == 'M' else obj.tolist(),
+                'dtype': obj.dtype.str}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _decode(obj):
+    """Inverse of _encode"""
+    if isinstance(obj, dict):
+        if '__datetime__' in obj:
+            return datetime.datetime.fromisoformat(obj['__datetime__'])
+        if '__ndarray__' in obj:
+            return np.array(obj['__ndarray__'], dtype=obj['dtype'])
+        return {key: _decode(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_decode(value) for value in obj]
+    return obj
+
+
+def write_meta(path, meta):
+    """Write dictionary with meta data as json. Handles numpy arrays and datetimes
+
+    Args:
+        path(str): path of the json file
+        meta(dict): meta data
+    """
+    with open(path, 'w') as f:
+        json.dump(_encode(meta), f)
+
+
+def read_meta(path):
+    """Read meta data written with write_meta
+
+    Args:
+        path(str): path of the json file
+
+    Returns:
+        meta(dict)
+    """
+    with open(path) as f:
+        return _decode(json.load(f))
+
+
+def _flatten(name, obj, arrays):
+    # Nested dicts and lists are stored with the path as key. e.g. "calibration_tables.0.row"
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            _flatten(name + '.' + key, value, arrays)
+    elif isinstance(obj, list):
+        arrays[name + '.__list__'] = np.array(len(obj))
+        for i, value in enumerate(obj):
+            _flatten(name + '.' + str(i), value, arrays)
+    elif obj is None:
+        arrays[name + '.__none__'] = np.array(0)
+    else:
+        arrays[name] = np.asarray(obj)
+
+
+def _unflatten(name, arrays, keys):
+    if name + '.__none__' in keys:
+        return None
+    if name in keys:
+        value = arrays[name]
+        return value.item() if value.ndim == 0 else value
+    if name + '.__list__' in keys:
+        return [_unflatten(name + '.' + str(i), arrays, keys) for i in range(int(arrays[name + '.__list__']))]
+    # dict. Find the keys one level down
+    prefix = name + '.'
+    children = []
+    for key in keys:
+        if key.startswith(prefix):
+            child = key[len(prefix):].split('.')[0]
+            if child not in children and child not in ('__list__', '__none__'):
+                children.append(child)
+    return {child: _unflatten(prefix + child, arrays, keys) for child in children}
+
+
+def write_tables(path, **tables):
+    """Write lists of dictionaries with numpy arrays (e.g. geo_tie_point and calibration_tables) to a npz file.
+    Unlike pickle the arrays can be read without executing any code.
+
+    Args:
+        path(str): path of the npz file
+        **tables: lists of dictionaries to save
+    """
+    arrays = {}
+    for name, table in tables.items():
+        _flatten(name, table, arrays)
+    np.savez(path, **arrays)
+
+
+def read_tables(path):
+    """Read tables written with write_tables
+
+    Args:
+        path(str): path of the npz file
+
+    Returns:
+        tables(dict): The tables with the names given to write_tables as keys
+    """
+    with np.load(path) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    keys = set(arrays)
+    names = []
+    for key in keys:
+        name = key.split('.')[0]
+        if name not in names:
+            names.append(name)
+    return {name: _unflatten(name, arrays, keys) for name in names}
+
+
+def write_bands(path, bands):
+    """Write each band as a .npy file that can be memory mapped
+
+    Args:
+        path(str): folder to write in
+        bands(list of 2d arrays): The bands
+    """
+    for i, band in enumerate(bands):
+        if isinstance(band, np.ndarray):
+            np.save(os.path.join(path, BAND_FILE % i), band)
+            continue
+        # Write bands that are not in memory (e.g. LazyBand) one block of rows at the time
+        dtype = np.dtype(band.dtype)
+        out = np.lib.format.open_memmap(os.path.join(path, BAND_FILE % i), mode='w+', dtype=dtype, shape=band.shape)
+        block_rows = max(2 ** 22 // max(band.shape[1], 1), 1)
+        for row_start in range(0, band.shape[0], block_rows):
+            out[row_start:row_start + block_rows, :] = band[row_start:row_start + block_rows, :]
+        out.flush()
+        del out
+
+
+def read_bands(path, n_bands, mmap=True):
+    """Read bands written with write_bands
+
+    Args:
+        path(str): folder the bands are written in
+        n_bands(int): number of bands
+        mmap(bool): If True the bands are memory mapped and only read from disk when used. The maps are copy on
+                    write: the bands can be changed in memory, but the changes are not written to the files
+
+    Returns:
+        bands(list of 2d numpy arrays)
+    """
+    mmap_mode = 'c' if mmap else None
+    return [np.load(os.path.join(path, BAND_FILE % i), mmap_mode=mmap_mode) for i in range(n_bands)]
@@ -0,0 +1,136 @@
+import numpy as np
+import warnings
+
+from . import tools
+
+
+def tile_windows(shape, size, stride, edge='shift'):
+    """Windows of (size x size) tiles of an image in row major order.
+
+    Args:
+        shape(tuple): (rows, columns) of the image
+        size(int): size of the tiles
+        stride(int): distance between the starts of the tiles
+        edge(str): What to do when the tiles do not end at the edge of the image.
+                    'shift' adds a tile ending at the edge (it overlaps the previous tile more),
+                    'pad' adds a tile that extends beyond the edge and 'drop' leaves the edge out.
+                    With 'shift' and 'drop' all tiles are inside the image
+
+    Returns:
+        list of ((row_start, row_stop), (column_start, column_stop))
+
+    Raises:
+        ValueError: Unknown edge
+    """
+    if edge not in ('shift', 'pad', 'drop'):
+        raise ValueError('edge must be "shift", "pad" or "drop"')
+
+    def starts(n):
+        if n < size:
+            return [] if edge == 'drop' else [0]
+        positions = list(range(0, n - size + 1, stride))
+        if positions[-1] + size < n:
+            if edge == 'shift':
+                positions.append(n - size)
+            elif edge == 'pad':
+                positions.append(positions[-1] + stride)
+        return positions
+
+    column_starts = starts(shape[1])
+    return [((row_start, row_start + size), (column_start, column_start + size))
+            for row_start in starts(shape[0]) for column_start in column_starts]
+
+
+def _read_strip(image, row_start, row_stop, calibrate, db):
+    """Rows of all bands as float32. Optionally calibrated and in dB. Complex bands are used as amplitudes"""
+    row_stop = min(row_stop, image.bands[0].shape[0])
+    factor = 20 if 'amplitude' in image.unit or 'complex' in image.unit else 10
+    strip = []
+    for band, table in zip(image.bands, image.calibration_tables or [None] * len(image.bands)):
+        raw = band[row_start:row_stop, :]
+        if calibrate is not None:
+            # Calibration and decibel in one pass
+            values = tools.calibration(raw, table['row'] - row_start, table['column'], table[calibrate],
+                                       tiles=1, dtype=np.float32, db=db)
+        else:
+            if np.iscomplexobj(raw):
+                # The imaginary part would be lost in the conversion to float32
+                raw = np.abs(raw)
+            values = np.asarray(raw, dtype=np.float32)
+            if db:
+                tools.to_db(values, factor, out=values)
+        strip.append(values)
+    return strip
+
+
+def _batches(image, windows, batch_size, calibrate, db):
+    """Generator of (batch, windows of the batch). See iter_tiles"""
+    n_bands = len(image.bands)
+    n_columns = image.bands[0].shape[1]
+    strip = None
+    strip_rows = None
+    for batch_start in range(0, len(windows), batch_size):
+        batch_windows = windows[batch_start:batch_start + batch_size]
+        size = batch_windows[0][0][1] - batch_windows[0][0][0]
+        batch = np.zeros((len(batch_windows), n_bands, size, size), dtype=np.float32)
+        for i, ((row_start, row_stop), (column_start, column_stop)) in enumerate(batch_windows):
+            # All tiles in a row of tiles are cut from the same strip
+            if strip_rows != (row_start, row_stop):
+                strip = _read_strip(image, row_start, row_stop, calibrate, db)
+                strip_rows = (row_start, row_stop)
+            column_stop = min(column_stop, n_columns)
+            for j in range(n_bands):
+                block = strip[j][:, column_start:column_stop]
+                batch[i, j, :block.shape[0], :block.shape[1]] = block
+        yield batch, batch_windows
+
+
+def iter_tiles(image, size, overlap=0, stride=None, batch_size=16, calibrate=None, db=False, edge='shift',
+               prefetch=0):
+    """Generator of batches of (size x size) tiles of an image. See SarImage.iter_tiles
+
+    The image is read one strip of size rows at the time, so bands that are LazyBand or numpy.memmap are
+    never read entirely. The strip is calibrated and converted to dB before the tiles are cut.
+
+    Args:
+        image(SarImage): image to tile
+        size(int): size of the tiles
+        overlap(int): number of pixels adjacent tiles overlap. Ignored if stride is given
+        stride(int): distance between the starts of the tiles. If None size - overlap
+        batch_size(int): number of tiles in a batch
+        calibrate(str): 'sigma_0', 'beta_0' or 'gamma'. If None the values of the bands are used
+        db(bool): Convert to decibel
+        edge(str): 'shift', 'pad' (with 0) or 'drop'. See tile_windows
+        prefetch(int): Number of batches prepared ahead in a background thread. 0 for no thread
+
+    Yields:
+        batch(4d numpy array): contiguous float32 array with shape (tiles, bands, size, size)
+        windows(list of tuple): ((row_start, row_stop), (column_start, column_stop)) of each tile
+        latitude(2d numpy array): latitude of the corners of each tile with shape (tiles, 4).
+                    Same corners as SarImage.footprint of a slice
+        longitude(2d numpy array): longitude of the corners of each tile
+
+    Raises:
+        ValueError: stride is not positive or unknown edge
+    """
+    if stride is None:
+        stride = size - overlap
+    if stride <= 0:
+        raise ValueError('stride must be positive. overlap must be smaller than size')
+    if calibrate is not None and 'raw' not in image.unit:
+        warnings.warn('Raw is not in units. The image have all ready been calibrated')
+
+    windows = tile_windows(image.bands[0].shape, size, stride, edge=edge)
+
+    def with_coordinates():
+        for batch, batch_windows in _batches(image, windows, batch_size, calibrate, db):
+            # The corners of all tiles of the batch in one call
+            window_array = np.array(batch_windows)
+            rows = window_array[:, 0, [0, 0, 1, 1]]
+            columns = window_array[:, 1, [0, 1, 0, 1]]
+            latitude, longitude = image.get_coordinate(rows, columns)
+            yield batch, batch_windows, latitude, longitude
+
+    if prefetch:
+        return tools.prefetch(with_coordinates(), prefetch)
+    return with_coordinates()
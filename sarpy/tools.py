@@ -1,70 +1,515 @@
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
+import queue
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
 from scipy import ndimage
 
 
-def calibration(band, rows, columns, calibration_values, tiles=4):
+def parallel_map(function, items, workers=None):
+    """Apply function to each item. Optionally concurrent in a thread pool.
+    Numpy, scipy and rasterio release the GIL in the heavy calls, so independent bands can be processed
+    in parallel threads.
+
+    Args:
+        function(callable): function of one argument
+        items(iterable): items to apply the function to
+        workers(int or concurrent.futures.Executor): Number of threads or an executor to use.
+                        If None or 1 the items are processed one at the time in the calling thread
+
+    Returns:
+        list with the result for each item
+    """
+    if workers is None or workers == 1:
+        return [function(item) for item in items]
+    if isinstance(workers, Executor):
+        return list(workers.map(function, items))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+
+def prefetch(iterable, n=1):
+    """Iterate over iterable in a background thread that keeps up to n items ready.
+    Useful when producing an item (e.g. reading and calibrating a tile) and using it can overlap.
+
+    Args:
+        iterable(iterable): items to produce
+        n(int): maximum number of items produced ahead
+
+    Yields:
+        the items of iterable. Exceptions in the background thread are raised in the caller
+    """
+    items = queue.Queue(maxsize=n)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up if the caller has stopped
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as error:
+            put((done, error))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        # Stop the thread if the caller stops early
+        stop.set()
+
+
+def _linear_weights(grid, points):
+    """Index of the grid point to the left of each point and the linear weight of the point to the right.
+
+    Points outside the grid are extrapolated from the first or last grid interval.
+
+    Args:
+        grid(1d numpy array): increasing grid coordinates
+        points(1d numpy array): coordinates to interpolate at
+
+    Returns:
+        index(1d numpy array of int): index of the left grid point
+        weight(1d numpy array of float): weight of the right grid point
+    """
+    grid = np.asarray(grid, dtype=float)
+    points = np.asarray(points, dtype=float)
+    index = np.clip(np.searchsorted(grid, points, side='right') - 1, 0, len(grid) - 2)
+    weight = (points - grid[index]) / (grid[index + 1] - grid[index])
+    return index, weight
+
+
+def interpolate_columns(columns, values, column_index):
+    """Linear interpolation of each row of a grid along the columns.
+
+    Args:
+        columns(1d numpy array): columns of the grid points
+        values(2d numpy array): grid values with shape (rows, columns)
+        column_index(1d numpy array): columns to interpolate at
+
+    Returns:
+        2d numpy array with shape (rows, len(column_index))
+    """
+    index, weight = _linear_weights(columns, column_index)
+    return values[:, index] * (1 - weight) + values[:, index + 1] * weight
+
+
+def interpolate_rows(rows, values, row_index):
+    """Linear interpolation of each column of a grid along the rows.
+
+    Args:
+        rows(1d numpy array): rows of the grid points
+        values(2d numpy array): grid values with shape (rows, columns)
+        row_index(1d numpy array): rows to interpolate at
+
+    Returns:
+        2d numpy array with shape (len(row_index), columns)
+    """
+    index, weight = _linear_weights(rows, row_index)
+    weight = weight[:, np.newaxis]
+    return values[index, :] * (1 - weight) + values[index + 1, :] * weight
+
+
+def grid_interpolation(rows, columns, values, row_index, column_index):
+    """Bilinear interpolation of a regular grid done separable. First along columns then along rows.
+
+    Args:
+        rows(1d numpy array): rows of the grid points
+        columns(1d numpy array): columns of the grid points
+        values(2d numpy array): grid values with shape (len(rows), len(columns))
+        row_index(1d numpy array): rows of the output
+        column_index(1d numpy array): columns of the output
+
+    Returns:
+        2d numpy array with shape (len(row_index), len(column_index))
+    """
+    return interpolate_rows(rows, interpolate_columns(columns, values, column_index), row_index)
+
+
+def _check_bounds(grid, start, stop, dimension):
+    # Same check as scipy.interpolate.RegularGridInterpolator. No extrapolation of calibration values
+    if (start < grid[0]) or (stop - 1 > grid[-1]):
+        raise ValueError('One of the requested xi is out of bounds in dimension %d' % dimension)
+
+
+def transform_noise(noise, row_start, row_step, column_start, column_step):
+    """Noise table (see s1._load_noise) with the indices transformed to new = (old - start) / step.
+    Used when an image is sliced, windowed or multilooked. The arrays of the values are shared.
+
+    Args:
+        noise(dict): noise table
+        row_start(number): row of the table that becomes row 0
+        row_step(number): rows of the table in one row of the new image
+        column_start(number): column of the table that becomes column 0
+        column_step(number): columns of the table in one column of the new image
+
+    Returns:
+        noise table (dict)
+    """
+    noise = dict(noise)
+    noise['row'] = (noise['row'] - row_start) / row_step
+    noise['column'] = (noise['column'] - column_start) / column_step
+    azimuth = []
+    for block in noise['azimuth']:
+        block = dict(block)
+        for key in ('row_min', 'row_max', 'row'):
+            block[key] = (block[key] - row_start) / row_step
+        for key in ('column_min', 'column_max'):
+            block[key] = (block[key] - column_start) / column_step
+        azimuth.append(block)
+    noise['azimuth'] = azimuth
+    return noise
+
+
+def _noise_power(noise, n_columns):
+    """Function returning the thermal noise power of rows of an image with n_columns columns.
+
+    The range noise grid is interpolated separable like the calibration grid and multiplied by the azimuth
+    noise of the block each pixel is in. Pixels outside all blocks have azimuth noise 1.
+
+    Args:
+        noise(dict): noise table. See s1._load_noise
+        n_columns(int): number of columns of the image
+
+    Returns:
+        noise_power(function): noise_power(row_start, row_end) returns a 2d numpy array with
+                    shape (row_end - row_start, n_columns)
+    """
+    # Interpolate the columns once for every range vector
+    column_values = interpolate_columns(noise['column'], noise['range'], np.arange(n_columns))
+    blocks = []
+    for block in noise['azimuth']:
+        # Pixel c is in the block if column_min <= c < column_max
+        column_start = min(max(int(np.ceil(block['column_min'])), 0), n_columns)
+        column_end = min(max(int(np.ceil(block['column_max'])), 0), n_columns)
+        if column_end > column_start:
+            blocks.append((block, column_start, column_end))
+
+    def noise_power(row_start, row_end):
+        power = interpolate_rows(noise['row'], column_values, np.arange(row_start, row_end))
+        for block, column_start, column_end in blocks:
+            block_start = min(max(int(np.ceil(block['row_min'])), row_start), row_end)
+            block_end = min(max(int(np.ceil(block['row_max'])), row_start), row_end)
+            if block_end > block_start:
+                values = np.interp(np.arange(block_start, block_end), block['row'], block['values'])
+                power[block_start - row_start:block_end - row_start, column_start:column_end] *= values[:, np.newaxis]
+        return power
+
+    return noise_power
+
+
+def remove_thermal_noise(band, noise, out=None, dtype=np.float64, block_rows=1024):
+    """Remove thermal noise from a non calibrated amplitude image as sqrt(max(band**2 - noise, 0)).
+    See https://sentinel.esa.int/documents/247904/2142675/Thermal-Denoising-of-Products-Generated-by-Sentinel-1-IPF
+
+    The image is processed in chunks of rows like calibration_blocks, so band can be a LazyBand or numpy.memmap.
+
+    Args:
+        band(2d array like): The non calibrated amplitude image. The amplitude of complex images is used
+        noise(dict): noise table with the indices of band. See s1._load_noise
+        out(2d numpy array): Preallocated array for the result. It can be band itself if band is a float array
+        dtype(data type): data type of the result if out is None
+        block_rows(int): number of image rows read at the time
+
+    Returns:
+        amplitude image without thermal noise (2d numpy array)
+
+    Raises:
+        ValueError: out has the wrong shape
+    """
+    n_rows, n_columns = band.shape
+    if out is None:
+        out = np.empty(band.shape, dtype=dtype)
+    elif out.shape != band.shape:
+        raise ValueError('out must have shape %s' % str(band.shape))
+    noise_power = _noise_power(noise, n_columns)
+    chunk_rows = max(2 ** 16 // max(n_columns, 1), 1)
+
+    for row_start in range(0, n_rows, block_rows):
+        row_end = min(row_start + block_rows, n_rows)
+        raw = band[row_start:row_end, :]
+        if np.iscomplexobj(raw):
+            raw = np.abs(raw)
+        for start in range(row_start, row_end, chunk_rows):
+            end = min(start + chunk_rows, row_end)
+            power = np.square(raw[start - row_start:end - row_start], dtype=np.float64)
+            power -= noise_power(start, end)
+            np.maximum(power, 0, out=power)
+            np.sqrt(power, out=out[start:end])
+    return out
+
+
+def calibration_blocks(band, rows, columns, calibration_values, block_rows, out=None, dtype=np.float64, db=False,
+                       noise=None):
+    """Generator calibrating an image one block of rows at the time using linear interpolation.
+
+    The columns of the calibration grid are interpolated once for each row of the grid
+    and the rows are interpolated for each block. Each block is processed in chunks of rows small enough
+    to stay in the cache: the interpolation, division and squaring (or decibel conversion) of a chunk are
+    done in one pass directly in the result, so the only large allocation per block is the block of the result.
+
+    Args:
+        band(2d array like): The non calibrated image. Any object with shape and 2d slicing
+                            e.g. a numpy array or a rasterio backed band. Complex (SLC) images are calibrated
+                            from the amplitude
+        rows(number): rows of calibration point
+        columns(number): columns of calibration point
+        calibration_values(2d numpy array): grid of calibration values
+        block_rows(int): number of image rows in each block
+        out(2d numpy array): If given the blocks are written into out and the yielded blocks are views of out.
+                            out can be band itself if band is a float array
+        dtype(data type): data type of the blocks if out is None
+        db(bool): Return the calibrated values in decibel, 10 * log10((band / calibration_values)**2)
+        noise(dict): noise table with the indices of band (see s1._load_noise). If given the thermal noise is
+                            removed in the same pass: max(band**2 - noise, 0) / calibration_values**2
+
+    Yields:
+        row_start(int): first row of the block
+        row_end(int): end of the block (exclusive)
+        calibrated block (2d numpy array)
+
+    Raises:
+        ValueError: The image is not inside the calibration grid
+    """
+    n_rows, n_columns = band.shape
+    _check_bounds(rows, 0, n_rows, 0)
+    _check_bounds(columns, 0, n_columns, 1)
+
+    # Interpolate the columns once for every row in the calibration grid
+    column_values = interpolate_columns(columns, calibration_values, np.arange(n_columns))
+    # About 64k pixels in each chunk
+    chunk_rows = max(2 ** 16 // max(n_columns, 1), 1)
+    noise_power = None if noise is None else _noise_power(noise, n_columns)
+
+    for row_start in range(0, n_rows, block_rows):
+        row_end = min(row_start + block_rows, n_rows)
+        if out is None:
+            block = np.empty((row_end - row_start, n_columns), dtype=dtype)
+        else:
+            block = out[row_start:row_end, :]
+        raw = band[row_start:row_end, :]
+        if np.iscomplexobj(raw):
+            # SLC. Calibrate the amplitude
+            raw = np.abs(raw)
+        index, weight = _linear_weights(rows, np.arange(row_start, row_end))
+
+        for start in range(0, row_end - row_start, chunk_rows):
+            end = min(start + chunk_rows, row_end - row_start)
+            w = weight[start:end, np.newaxis]
+            img_cal = column_values[index[start:end]] * (1 - w) + column_values[index[start:end] + 1] * w
+            chunk = block[start:end]
+            if noise_power is not None:
+                # Subtract the noise from the intensities in float64. The noise is close to the intensity
+                power = np.square(raw[start:end], dtype=np.float64)
+                power -= noise_power(row_start + start, row_start + end)
+                np.maximum(power, 0, out=power)
+                np.divide(power, np.square(img_cal, out=img_cal), out=chunk)
+                factor = 10
+            else:
+                # 10 * log10(x ** 2) = 20 * log10(x) without the squaring
+                np.divide(raw[start:end], img_cal, out=chunk)
+                factor = 20
+                if not db:
+                    np.square(chunk, out=chunk)
+            if db:
+                with np.errstate(divide='ignore'):
+                    np.log10(chunk, out=chunk)
+                np.multiply(chunk, factor, out=chunk)
+        yield row_start, row_end, block
+
+
+def calibration(band, rows, columns, calibration_values, tiles=4, out=None, dtype=np.float64, db=False,
+                noise=None):
     """Calibrates image using linear interpolation.
     See https://sentinel.esa.int/documents/247904/685163/S1-Radiometric-Calibration-V1.0.pdf
 
+    The calibration grid is interpolated separable. The columns are interpolated once for each row of
+    the grid and the rows are interpolated for one block of image rows at the time.
+    The result equals bilinear interpolation with scipy.interpolate.RegularGridInterpolator within float64
+    rounding (a relative difference of about 1e-15), but it is not bit-identical because the operations are
+    done in a different order.
+
     Args:
         band(2d numpy array): The non calibrated image
         rows(number): rows of calibration point
         columns(number): columns of calibration point
         calibration_values(2d numpy array): grid of calibration values
         tiles(int): number of tiles the image is divided into. This saves memory but reduce speed a bit
+        out(2d numpy array): Preallocated array for the result. It can be band itself if band is a float array
+        dtype(data type): data type of the result if out is None. e.g. np.float32 to halve the memory
+        db(bool): Return the calibrated image in decibel (10 * log10). Done in the same pass as the calibration
+        noise(dict): noise table with the indices of band (see s1._load_noise). If given the thermal noise is
+                            removed in the same pass as the calibration
 
     Returns:
         calibrated image (2d numpy array)
 
     Raises:
+        ValueError: The image is not inside the calibration grid or out has the wrong shape
     """
+    if out is None:
+        out = np.empty(band.shape, dtype=dtype)
+    elif out.shape != band.shape:
+        raise ValueError('out must have shape %s' % str(band.shape))
+    block_rows = max(int(np.ceil(band.shape[0] / tiles)), 1)
+    # Calibrate one block of rows at the time directly into the result
+    for _ in calibration_blocks(band, rows, columns, calibration_values, block_rows, out=out, db=db, noise=noise):
+        pass
+    return out
+
+
+def to_db(img, factor=10, out=None, dtype=None):
+    """Convert to decibel as factor * log10(img). The log and the multiplication are done in place in the result.
+    Use factor 10 for intensities (e.g. calibrated images) and 20 for amplitudes.
+    Earlier versions of sarpy used the natural logarithm, which is not decibel.
 
-    # Create interpolation function
-    f = RegularGridInterpolator((rows, columns), calibration_values)
-
-    result = np.zeros(band.shape)
-    # Calibrate one tile at the time
-    column_start = 0
-    column_max = band.shape[1]
-    for i in range(tiles):
-        column_end = int(column_max / tiles * (i + 1))
-        # Create array of point where calibration is needed
-        column_mesh, row_mesh = np.meshgrid(np.array(range(column_start, column_end)), np.array(range(band.shape[0])))
-        points = np.array([row_mesh.reshape(-1), column_mesh.reshape(-1)]).T
-        # Get the image tile and the calibration values for it
-        img_tile = band[:, column_start:column_end]
-        img_cal = f(points).reshape(img_tile.shape)
-        # Set in result
-        result[:, column_start:column_end] = (img_tile / img_cal)
-
-        column_start = column_end
-    return result ** 2
-
-
-def boxcar(img, kernel_size, **kwargs):
+    Args:
+        img(2d numpy array): image. Complex (SLC) images are converted from the amplitude. Use factor 20
+        factor(number): 10 for intensities and 20 for amplitudes
+        out(2d numpy array): Preallocated array for the result. It can be img itself if img is a float array
+        dtype(data type): data type of the result if out is None. If None the numpy default for log of img
+
+    Returns:
+        image in decibel (2d numpy array)
+    """
+    img = np.asarray(img)
+    if np.iscomplexobj(img):
+        img = np.abs(img)
+    if out is None and dtype is not None:
+        out = np.empty(img.shape, dtype=dtype)
+    out = np.log10(img, out=out)
+    return np.multiply(out, factor, out=out)
+
+
+def boxcar(img, kernel_size, method='running_sum', **kwargs):
     """Simple (kernel_size x kernel_size) boxcar filter.
 
+    The default method uses running sums (scipy.ndimage.uniform_filter), so the cost per pixel does not
+    depend on the kernel size. method='convolve' is the earlier implementation with convolutions.
+    Both give the same result including the borders given by mode and cval.
+
     Args:
         img(2d numpy array): image
         kernel_size(int): size of kernel
-        **kwargs: Additional arguments passed to scipy.ndimage.convolve
+        method(str): 'running_sum' or 'convolve'
+        **kwargs: Additional arguments passed to scipy.ndimage.convolve (mode, cval, origin, output).
+                output can be a preallocated float array, which may be img itself, or a data type e.g. np.float32.
+                The default is float64 for running_sum and the data type of img (float64 for integers) for convolve
 
     Returns:
         Filtered image
 
     Raises:
+        ValueError: Unknown method
     """
+    if method == 'running_sum':
+        # uniform_filter is a correlation. Convert the origin of the convolution (differs for even kernels)
+        origin = np.asarray(kwargs.pop('origin', 0))
+        origin = -origin - (1 - kernel_size % 2)
+        output = kwargs.pop('output', np.float64)
+        return ndimage.uniform_filter(img, kernel_size, output=output, origin=origin.tolist(), **kwargs)
+
+    if method != 'convolve':
+        raise ValueError('method must be "running_sum" or "convolve"')
+
+    # Integer images are averaged in float64
+    output = kwargs.pop('output', None)
+    if output is None:
+        output = img.dtype if np.issubdtype(img.dtype, np.inexact) else np.float64
+
     # For small kernels simple convolution
     if kernel_size < 8:
         kernel = np.ones([kernel_size,kernel_size])
-        box_img = ndimage.convolve(img, kernel, **kwargs)/kernel_size**2
+        box_img = ndimage.convolve(img, kernel, output=output, **kwargs)
 
     # For large kernels use Separable Filters. (https://www.youtube.com/watch?v=SiJpkucGa1o)
     else:
         kernel1 = np.ones([kernel_size, 1])
         kernel2 = np.ones([1, kernel_size])
-        box_img = ndimage.convolve(img, kernel1, **kwargs) / kernel_size
-        box_img = ndimage.convolve(box_img, kernel2, **kwargs) / kernel_size
+        box_img = ndimage.convolve(img, kernel1, output=output, **kwargs)
+        box_img = ndimage.convolve(box_img, kernel2, output=box_img, **kwargs)
 
+    # Normalise in place, so a preallocated output holds the result
+    box_img /= kernel_size**2
     return box_img
+
+
+def multilook(band, az_looks, rg_looks, amplitude=False, edge='drop', block_rows=1024, dtype=np.float64):
+    """Multilook an image by averaging the intensities of blocks of (az_looks x rg_looks) pixels.
+    Averaging intensities (not amplitudes or dB) gives an equivalent number of looks of about
+    az_looks * rg_looks for uncorrelated speckle.
+
+    The image is read one strip of whole blocks at the time and each strip is reduced with a reshape,
+    so band can be a LazyBand or numpy.memmap larger than memory.
+
+    Args:
+        band(2d array like): image. Any object with shape and 2d slicing. Complex (SLC) images are averaged
+                    as intensities |band|**2. Use amplitude to get the amplitude of the average
+        az_looks(int): number of rows in a block
+        rg_looks(int): number of columns in a block
+        amplitude(bool): band is amplitudes. The mean of the squares is taken and the square root returned
+        edge(str): 'drop' to drop the rows and columns at the end that do not fill a block, or 'partial'
+                    to average the pixels that are there
+        block_rows(int): approximate number of rows read at the time
+        dtype(data type): data type of the result
+
+    Returns:
+        multilooked image (2d numpy array)
+
+    Raises:
+        ValueError: Unknown edge
+    """
+    n_rows, n_columns = band.shape
+    if edge == 'drop':
+        out_rows, out_columns = n_rows // az_looks, n_columns // rg_looks
+        n_rows, n_columns = out_rows * az_looks, out_columns * rg_looks
+    elif edge == 'partial':
+        out_rows, out_columns = -(-n_rows // az_looks), -(-n_columns // rg_looks)
+    else:
+        raise ValueError('edge must be "drop" or "partial"')
+
+    result = np.empty((out_rows, out_columns), dtype=dtype)
+    # Number of pixels in each block. Only less than the looks at a partial edge
+    column_counts = np.minimum(n_columns - np.arange(out_columns) * rg_looks, rg_looks)
+    strip_blocks = max(block_rows // az_looks, 1)
+
+    for out_start in range(0, out_rows, strip_blocks):
+        out_end = min(out_start + strip_blocks, out_rows)
+        row_start = out_start * az_looks
+        row_end = min(out_end * az_looks, n_rows)
+
+        # Zero padded strip of whole blocks
+        strip = np.zeros(((out_end - out_start) * az_looks, out_columns * rg_looks))
+        block = band[row_start:row_end, :n_columns]
+        if np.iscomplexobj(block):
+            # Intensity of complex values. The imaginary part would be lost when copied to the float strip
+            np.square(np.abs(block), out=strip[:row_end - row_start, :n_columns], dtype=np.float64)
+        else:
+            strip[:row_end - row_start, :n_columns] = block
+            if amplitude:
+                np.square(strip, out=strip)
+        sums = strip.reshape(out_end - out_start, az_looks, out_columns, rg_looks).sum(axis=(1, 3))
+
+        row_counts = np.minimum(n_rows - np.arange(out_start, out_end) * az_looks, az_looks)
+        sums /= row_counts[:, np.newaxis] * column_counts
+        if amplitude:
+            np.sqrt(sums, out=sums)
+        result[out_start:out_end, :] = sums
+    return result